@@ -8,9 +8,10 @@ import re
 logging.basicConfig(filename='xml_processing.log', level=logging.ERROR, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Hardcoded input and output paths
-xml_folder = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Collisions"
-output_file = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Filtered_Collisions\All_Collisions.xlsx"
+# Input and output paths (SIM_OUTPUT_DIR overrides the default sweep output directory)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new")
+xml_folder = os.path.join(output_base_dir, "Collisions")
+output_file = os.path.join(output_base_dir, "Filtered_Collisions", "All_Collisions.xlsx")
 
 # Ensure the output file has a valid extension (e.g., .xlsx)
 if not output_file.lower().endswith('.xlsx'):
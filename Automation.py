@@ -3,8 +3,92 @@ import pandas as pd
 import xml.etree.ElementTree as ET
 import subprocess
 import shutil
+import signal
+import sys
+import time
+import tempfile
 from itertools import product
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from Instrumentation import StageRecorder, ProgressTracker, get_path_size
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Run status values reported by run_simulation
+STATUS_SUCCESS = "success"
+STATUS_TIMEOUT = "timeout"
+STATUS_OOM = "oom"
+STATUS_KILLED = "killed"
+STATUS_SUMO_ERROR = "sumo_error"
+STATUS_CANCELLED = "cancelled"
+
+# Statuses worth another attempt. SUMO is deterministic for a given config and seed, so runs
+# stopped by the watchdog (timeout, oom) or failing on their own (sumo_error, e.g. a bad net or
+# config) would fail the same way again. A SIGKILL the watchdog did not send, such as the kernel
+# OOM killer reacting to other runs on the host, depends on the host's load and may not recur.
+RETRY_STATUSES = [STATUS_KILLED]
+
+# Wall-clock limit (s) for runs whose limit cannot be derived from timeout or timeout_factor,
+# e.g. a config without <time><end>, so that a gridlocked run cannot hold a worker forever
+DEFAULT_TIMEOUT = 3600
+
+# File name prefix of each SUMO output written per run
+OUTPUT_PREFIXES = {
+    "collision-output": "collisions",
+    "statistic-output": "statistics",
+    "tripinfo-output": "tripinfo",
+    "lanechange-output": "lanechange",
+    "fcd-output": "fcd"
+}
+
+# Vehicles the reduced output profiles keep per-vehicle data for (the ego and any known neighbours)
+EGO_IDS = ["v_0"]
+
+# Radius (m) around the ego vehicles within which other vehicles are written to the FCD output
+FCD_NEIGHBOUR_RADIUS = 50
+
+# Outputs no compile script reads; the reduced profiles remove them if the base config sets them
+UNUSED_OUTPUTS = ["summary-output", "queue-output", "emission-output", "netstate-dump", "full-output",
+                  "vtk-output", "amitran-output", "edgedata-output", "lanedata-output", "fcd-output",
+                  "person-summary-output", "vehroute-output", "stop-output"]
+
+_COMPILED_OUTPUTS = ["collision-output", "statistic-output", "tripinfo-output", "lanechange-output"]
+_EGO_OPTIONS = {
+    # tripinfo-output equips every vehicle unless the device is assigned explicitly
+    ("output", "device.tripinfo.probability"): "0",
+    ("output", "device.tripinfo.explicit"): ",".join(EGO_IDS),
+    ("report", "no-step-log"): "true"
+}
+
+# SUMO outputs written per run and options added to the config for each output profile:
+# "full" writes complete outputs, "ego" restricts tripinfo to EGO_IDS (lanechange-output has no
+# vehicle filter and also feeds the neighbour analysis of Compilation_LaneChangeEvents.py), and
+# "ego_fcd" adds an FCD output of the ego and its neighbours for FCD_SurrogateSafety.py
+OUTPUT_PROFILES = {
+    "full": {
+        "outputs": _COMPILED_OUTPUTS,
+        "options": {},
+        "disabled_outputs": []
+    },
+    "ego": {
+        "outputs": _COMPILED_OUTPUTS,
+        "options": _EGO_OPTIONS,
+        "disabled_outputs": UNUSED_OUTPUTS
+    },
+    "ego_fcd": {
+        "outputs": _COMPILED_OUTPUTS + ["fcd-output"],
+        "options": {
+            **_EGO_OPTIONS,
+            ("output", "device.fcd.probability"): "0",
+            ("output", "device.fcd.explicit"): ",".join(EGO_IDS),
+            ("output", "device.fcd.radius"): str(FCD_NEIGHBOUR_RADIUS)
+        },
+        "disabled_outputs": [o for o in UNUSED_OUTPUTS if o != "fcd-output"]
+    }
+}
 
 def extract_data_from_csv(csv_file):
     """Extract relevant data from the CSV file for all IDs."""
@@ -120,63 +204,225 @@ def filter_collision_files(output_collisions_dir, filtered_collisions_dir):
         except Exception as e:
             print(f"Error processing file {file_name}: {e}")
 
-def run_simulation(config_file):
-    """Run a single SUMO simulation."""
+def get_scenario_end_time(config_file):
+    """Return the <time><end> value of a SUMO configuration file in seconds, or None if not set."""
     try:
-        result = subprocess.run(["sumo", "-c", config_file], check=True, capture_output=True, text=True)
-        print(f"Simulation completed for {config_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error occurred during simulation for {config_file}: {e}")
-        print(f"SUMO Error Output: {e.stderr}")
-    except Exception as e:
-        print(f"Unexpected error during simulation: {e}")
+        root = ET.parse(config_file).getroot()
+        end_elem = root.find("time/end")
+        if end_elem is not None and end_elem.get("value") is not None:
+            return float(end_elem.get("value"))
+    except (ET.ParseError, OSError, ValueError) as e:
+        print(f"Could not read end time from {config_file}: {e}")
+    return None
 
-def main():
-    
-    base_dir = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4"
-    input_csv_file = os.path.join(base_dir, "Parameters_to_change - Copy.csv")
-    input_xml_file = os.path.join(base_dir, "Rou04.rou.xml")
-    config_file = os.path.join(base_dir, "town04.sumocfg")
-    net_file_path = os.path.join(base_dir, "Town04.net.xml")  
-    
-    # Output directories
-    output_dir = os.path.join(base_dir, "Output_new")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    route_files_dir = os.path.join(output_dir, "Route_files")
-    output_collisions_dir = os.path.join(output_dir, "Collisions")
-    output_statistics_dir = os.path.join(output_dir, "Statistics")
-    output_tripinfo_dir = os.path.join(output_dir, "Tripinfo")
-    output_lanechange_dir = os.path.join(output_dir, "lanechange")
-    filtered_collisions_dir = os.path.join(output_dir, "Filtered_Collisions")
-    temp_config_dir = os.path.join(base_dir, "temp_configs")
-    
-    for directory in [route_files_dir, output_collisions_dir, output_statistics_dir, 
-                     output_tripinfo_dir, output_lanechange_dir, filtered_collisions_dir, 
-                     temp_config_dir]:
-        os.makedirs(directory, exist_ok=True)
+def _get_child_pids(pid):
+    """Return the pids of all descendants of a process using /proc (Linux only)."""
+    children = []
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            for child in f.read().split():
+                children.append(int(child))
+                children.extend(_get_child_pids(int(child)))
+    except OSError:
+        pass
+    return children
 
-    print("Extracting data from CSV...")
-    csv_data = extract_data_from_csv(input_csv_file)
-    if not csv_data:
-        print("No valid ranges found in CSV. Exiting.")
-        return
+def get_process_rss_mb(pid):
+    """Return the resident set size of a process and its children in MB, or None if it cannot be measured."""
+    try:
+        if psutil is not None:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        total_kb = None
+        for p in [pid] + _get_child_pids(pid):
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb = (total_kb or 0) + int(line.split()[1])
+        return total_kb / 1024 if total_kb is not None else None
+    except Exception:
+        return None
 
-    print("Generating route files...")
-    generate_route_files(input_xml_file, route_files_dir, csv_data)
-    print("Route file generation completed.")
+def _kill_process_tree(process):
+    """Kill a process started by _run_simulation_once together with any children it spawned."""
+    try:
+        if psutil is not None:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                child.kill()
+        elif os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+    except Exception:
+        pass
+    process.kill()
 
-    route_files = [f for f in os.listdir(route_files_dir) if f.endswith(".xml")]
+def _classify_failure(returncode, stderr):
+    """Classify a non-zero SUMO exit the watchdog did not cause.
+
+    SUMO failing to allocate memory itself is oom; a SIGKILL from outside (e.g. the kernel
+    OOM killer) is killed; anything else is a regular SUMO error.
+    """
+    if "bad_alloc" in (stderr or "") or "out of memory" in (stderr or "").lower():
+        return STATUS_OOM
+    if returncode == -9:
+        return STATUS_KILLED
+    return STATUS_SUMO_ERROR
+
+def _max_peak(*values):
+    """Return the largest of the measured values, or None if none was measured."""
+    measured = [v for v in values if v is not None]
+    return max(measured) if measured else None
+
+def _reap(process, block):
+    """Reap a finished process with os.wait4; returns its peak RSS in MB, or False if still running.
+
+    The exit code is stored on the Popen object. Returns None if the peak could not be read,
+    e.g. because Popen reaped the process first while killing it.
+    """
+    try:
+        pid, wait_status, rusage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        process.wait()
+        return None
+    if pid == 0:
+        return False
+    process.returncode = -os.WTERMSIG(wait_status) if os.WIFSIGNALED(wait_status) else os.WEXITSTATUS(wait_status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _run_simulation_once(config_file, timeout, max_rss_mb, poll_interval, stop_event=None):
+    """Run SUMO once under the watchdog and return (status, returncode, stderr, peak_rss_mb, cpu_time).
+
+    On POSIX the peak RSS is the child's ru_maxrss from os.wait4, so runs shorter than the poll
+    interval are measured too; elsewhere it is the largest sampled RSS. It is None when nothing
+    could be measured.
+    """
+    children_cpu_start = os.times().children_user + os.times().children_system
+    use_wait4 = hasattr(os, "wait4")
+    # stderr goes to a file so a chatty run cannot block on a full pipe while it is not read
+    with tempfile.TemporaryFile(mode="w+") as stderr_file:
+        process = subprocess.Popen(["sumo", "-c", config_file], stdout=subprocess.DEVNULL,
+                                   stderr=stderr_file, text=True,
+                                   start_new_session=(os.name == "posix"))
+        start_time = time.monotonic()
+        peak_rss_mb = None
+        status = None
+        # Poll quickly at first so short runs are not held up, then every poll_interval
+        interval = min(0.01, poll_interval)
+        while True:
+            if use_wait4:
+                rusage_rss_mb = _reap(process, block=False)
+                if rusage_rss_mb is not False:
+                    peak_rss_mb = _max_peak(peak_rss_mb, rusage_rss_mb)
+                    break
+            elif process.poll() is not None:
+                break
+
+            rss_mb = get_process_rss_mb(process.pid)
+            peak_rss_mb = _max_peak(peak_rss_mb, rss_mb)
+            if max_rss_mb is not None and rss_mb is not None and rss_mb > max_rss_mb:
+                status = STATUS_OOM
+            elif timeout is not None and time.monotonic() - start_time > timeout:
+                status = STATUS_TIMEOUT
+            elif stop_event is not None and stop_event.is_set():
+                status = STATUS_CANCELLED
+            if status is not None:
+                _kill_process_tree(process)
+                if use_wait4:
+                    peak_rss_mb = _max_peak(peak_rss_mb, _reap(process, block=True))
+                else:
+                    process.wait()
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, poll_interval)
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    if status is None:
+        status = STATUS_SUCCESS if process.returncode == 0 else _classify_failure(process.returncode, stderr)
+    cpu_time = os.times().children_user + os.times().children_system - children_cpu_start
+    return status, process.returncode, stderr, peak_rss_mb, cpu_time
+
+def run_simulation(config_file, timeout=None, timeout_factor=None, max_rss_mb=None,
+                   retries=0, poll_interval=0.5, stop_event=None):
+    """Run a single SUMO simulation under a watchdog and return a result dictionary.
 
+    The wall-clock limit is `timeout` seconds, or `timeout_factor` times the scenario end
+    time when only the factor is given, and DEFAULT_TIMEOUT when neither gives a limit.
+    Runs whose sumo process exceeds `max_rss_mb` are killed. Runs that fail with a status in
+    RETRY_STATUSES are retried up to `retries` times. Setting `stop_event` (a threading.Event)
+    kills the run. The returned "status" is one of success, timeout, oom, killed, sumo_error
+    or cancelled.
+    """
+    if timeout is None and timeout_factor is not None:
+        end_time = get_scenario_end_time(config_file)
+        if end_time is not None and end_time > 0:
+            timeout = end_time * timeout_factor
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+
+    result = {"config_file": config_file, "status": None, "returncode": None,
+              "attempts": 0, "elapsed": 0.0, "cpu_time": 0.0, "peak_rss_mb": None, "stderr": ""}
+    start_time = time.monotonic()
+    for attempt in range(1, retries + 2):
+        result["attempts"] = attempt
+        try:
+            status, returncode, stderr, peak_rss_mb, cpu_time = _run_simulation_once(
+                config_file, timeout, max_rss_mb, poll_interval, stop_event)
+        except Exception as e:
+            status, returncode, stderr, peak_rss_mb, cpu_time = STATUS_SUMO_ERROR, None, str(e), None, 0.0
+        result.update(status=status, returncode=returncode, stderr=stderr,
+                      cpu_time=result["cpu_time"] + cpu_time,
+                      peak_rss_mb=_max_peak(result["peak_rss_mb"], peak_rss_mb))
+
+        if status == STATUS_SUCCESS:
+            print(f"Simulation completed for {config_file}")
+            break
+        print(f"Simulation {status} for {config_file} (attempt {attempt}/{retries + 1})")
+        if status == STATUS_SUMO_ERROR and stderr:
+            print(f"SUMO Error Output: {stderr}")
+        if status not in RETRY_STATUSES:
+            break
+
+    result["elapsed"] = time.monotonic() - start_time
+    return result
+
+def apply_output_profile(root, profile_name):
+    """Set the options of an output profile on a parsed SUMO configuration and drop unused outputs."""
+    profile = OUTPUT_PROFILES[profile_name]
+    for section in list(root):
+        for elem in list(section):
+            if elem.tag in profile["disabled_outputs"]:
+                section.remove(elem)
+
+    for (section_name, option), value in profile["options"].items():
+        section = root.find(section_name)
+        if section is None:
+            section = ET.SubElement(root, section_name)
+        elem = section.find(option)
+        if elem is None:
+            elem = ET.SubElement(section, option)
+        elem.set("value", value)
+    return profile["outputs"]
+
+def write_config_files(config_file, net_file_path, route_files_dir, output_dirs, temp_config_dir,
+                       output_profile="full"):
+    """Write one SUMO configuration per route file and return a dict of config file -> output paths.
+
+    `output_dirs` maps each output option written by the output profile (see OUTPUT_PROFILES)
+    to the directory its files go to.
+    """
     try:
         tree = ET.parse(config_file)
         root = tree.getroot()
     except ET.ParseError:
         print(f"Error parsing configuration file: {config_file}")
-        return
+        return {}
     except Exception as e:
         print(f"Error reading configuration file: {e}")
-        return
+        return {}
 
     input_tag = root.find("input")
     if input_tag is None:
@@ -186,7 +432,10 @@ def main():
     if output_tag is None:
         output_tag = ET.SubElement(root, "output")
 
-    config_files = []
+    outputs = apply_output_profile(root, output_profile)
+
+    route_files = [f for f in os.listdir(route_files_dir) if f.endswith(".xml")]
+    config_files = {}
     for route_file in route_files:
         route_file_path = os.path.join(route_files_dir, route_file)
         base_name = os.path.splitext(route_file)[0]
@@ -202,10 +451,8 @@ def main():
         net_file_elem.set("value", net_file_path)
 
         output_paths = {
-            "collision-output": os.path.join(output_collisions_dir, f"collisions_{base_name}.xml"),
-            "statistic-output": os.path.join(output_statistics_dir, f"statistics_{base_name}.xml"),
-            "tripinfo-output": os.path.join(output_tripinfo_dir, f"tripinfo_{base_name}.xml"),
-            "lanechange-output": os.path.join(output_lanechange_dir, f"lanechange_{base_name}.xml")
+            output_type: os.path.join(output_dirs[output_type], f"{OUTPUT_PREFIXES[output_type]}_{base_name}.xml")
+            for output_type in outputs
         }
         
         for output_type, output_path in output_paths.items():
@@ -216,13 +463,133 @@ def main():
 
         updated_config_file = os.path.join(temp_config_dir, f"temp_config_{base_name}.sumocfg")
         tree.write(updated_config_file, encoding="UTF-8", xml_declaration=True)
-        config_files.append(updated_config_file)
+        config_files[updated_config_file] = output_paths
+
+    return config_files
+
+def run_simulations(config_files, max_workers=8, timeout=None, timeout_factor=None,
+                    max_rss_mb=None, retries=0, recorder=None):
+    """Run all simulations in a process pool and return their result dictionaries.
+
+    `config_files` maps each configuration file to its output paths, which are used to
+    record the bytes written by every run when a StageRecorder is given.
+    """
+    results = []
+    progress = ProgressTracker(len(config_files), recorder)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(run_simulation, config_file, timeout, timeout_factor,
+                                   max_rss_mb, retries): config_file
+                   for config_file in config_files}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                config_file = pending.pop(future)
+                result = future.result()
+                results.append(result)
+                # Runs not yet picked up by a worker
+                queue_depth = max(len(pending) - max_workers, 0)
+                if recorder is not None:
+                    recorder.emit("stage", "sumo_run", config_file=config_file,
+                                  status=result["status"], attempts=result["attempts"],
+                                  wall_time=result["elapsed"], cpu_time=result["cpu_time"],
+                                  peak_rss_mb=result["peak_rss_mb"],
+                                  bytes_written=get_path_size(config_files[config_file].values()),
+                                  queue_depth=queue_depth)
+                progress.update(queue_depth=queue_depth)
+    return results
+
+def main():
+    
+    base_dir = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4"
+    input_csv_file = os.path.join(base_dir, "Parameters_to_change - Copy.csv")
+    input_xml_file = os.path.join(base_dir, "Rou04.rou.xml")
+    config_file = os.path.join(base_dir, "town04.sumocfg")
+    net_file_path = os.path.join(base_dir, "Town04.net.xml")  
+    
+    # Output directories
+    output_dir = os.path.join(base_dir, "Output_new")
+    os.makedirs(output_dir, exist_ok=True)
+    
+    route_files_dir = os.path.join(output_dir, "Route_files")
+    output_collisions_dir = os.path.join(output_dir, "Collisions")
+    output_statistics_dir = os.path.join(output_dir, "Statistics")
+    output_tripinfo_dir = os.path.join(output_dir, "Tripinfo")
+    output_lanechange_dir = os.path.join(output_dir, "lanechange")
+    output_fcd_dir = os.path.join(output_dir, "Fcd")
+    filtered_collisions_dir = os.path.join(output_dir, "Filtered_Collisions")
+    temp_config_dir = os.path.join(base_dir, "temp_configs")
+
+    # Watchdog limits per run. Without timeout or an end time for timeout_factor, runs are
+    # limited to DEFAULT_TIMEOUT; max_rss_mb = None disables the memory limit
+    timeout = None          # absolute wall-clock limit in seconds
+    timeout_factor = 2.0    # wall-clock seconds allowed per simulated second when timeout is None
+    max_rss_mb = 4096
+    retries = 1             # extra attempts for runs killed from outside the watchdog
+    max_workers = 8
+
+    # SUMO outputs per run: "full", "ego" (tripinfo of EGO_IDS only) or "ego_fcd" (adds ego/neighbour FCD)
+    output_profile = "ego"
+
+    # Shared SQLite queue for multi-host sweeps (None runs everything on this machine). When set,
+    # runs are published to the queue and executed by 'python Distributed.py --db <queue_db> worker'
+    # on any host that sees the same filesystem; use a new queue file for every sweep.
+    queue_db = None
+
+    # Stage instrumentation; list stage names in profile_stages (or "*") to run them under cProfile
+    metrics_file = os.path.join(output_dir, "pipeline_metrics.jsonl")
+    recorder = StageRecorder(metrics_file, profile_stages=[])
+    
+    for directory in [route_files_dir, output_collisions_dir, output_statistics_dir, 
+                     output_tripinfo_dir, output_lanechange_dir, output_fcd_dir,
+                     filtered_collisions_dir, temp_config_dir]:
+        os.makedirs(directory, exist_ok=True)
+
+    print("Extracting data from CSV...")
+    csv_data = extract_data_from_csv(input_csv_file)
+    if not csv_data:
+        print("No valid ranges found in CSV. Exiting.")
+        return
 
-    print("Running simulations in parallel...")
-    with ProcessPoolExecutor(max_workers=8) as executor:
-        futures = [executor.submit(run_simulation, config_file) for config_file in config_files]
-        for future in as_completed(futures):
-            future.result()  
+    print("Generating route files...")
+    with recorder.stage("generate_route_files", output_paths=[route_files_dir]):
+        generate_route_files(input_xml_file, route_files_dir, csv_data)
+    print("Route file generation completed.")
+
+    output_dirs = {
+        "collision-output": output_collisions_dir,
+        "statistic-output": output_statistics_dir,
+        "tripinfo-output": output_tripinfo_dir,
+        "lanechange-output": output_lanechange_dir,
+        "fcd-output": output_fcd_dir
+    }
+    with recorder.stage("write_config_files", output_paths=[temp_config_dir], output_profile=output_profile):
+        config_files = write_config_files(config_file, net_file_path, route_files_dir,
+                                          output_dirs, temp_config_dir, output_profile)
+    if not config_files:
+        print("No configuration files written. Exiting.")
+        return
+
+    if queue_db is not None:
+        from Distributed import publish_runs, wait_for_queue
+
+        print(f"Publishing simulations to {queue_db} and waiting for workers...")
+        with recorder.stage("run_simulations", output_paths=list(output_dirs.values()),
+                            runs=len(config_files)):
+            # The watchdog settings travel with the runs, so every worker applies them
+            publish_runs(queue_db, config_files,
+                         limits={"timeout": timeout, "timeout_factor": timeout_factor, "max_rss_mb": max_rss_mb},
+                         max_attempts=retries + 1)
+            status_counts = wait_for_queue(queue_db, recorder=recorder)
+    else:
+        print("Running simulations in parallel...")
+        with recorder.stage("run_simulations", output_paths=list(output_dirs.values()),
+                            runs=len(config_files)):
+            results = run_simulations(config_files, max_workers, timeout, timeout_factor,
+                                      max_rss_mb, retries, recorder)
+        status_counts = {}
+        for result in results:
+            status_counts[result["status"]] = status_counts.get(result["status"], 0) + 1
+    print("Simulation results: " + ", ".join(f"{status}={count}" for status, count in status_counts.items()))
 
     try:
         shutil.rmtree(temp_config_dir)
@@ -230,9 +597,10 @@ def main():
         print(f"Error cleaning up temporary files: {e}")
 
     print("\nFiltering collision files...")
-    filter_collision_files(output_collisions_dir, filtered_collisions_dir)
+    with recorder.stage("filter_collision_files", output_paths=[filtered_collisions_dir]):
+        filter_collision_files(output_collisions_dir, filtered_collisions_dir)
 
-    print("\nAll tasks completed.")
+    print(f"\nAll tasks completed. Stage metrics written to {metrics_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
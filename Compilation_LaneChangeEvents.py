@@ -0,0 +1,177 @@
+import os
+import re
+import logging
+import xml.etree.ElementTree as ET
+from array import array
+import numpy as np
+import pandas as pd
+
+# Set up logging
+logging.basicConfig(filename='xml_processing.log', level=logging.ERROR,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Input and output paths (SIM_OUTPUT_DIR overrides the default sweep output directory)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new")
+xml_folder = os.path.join(output_base_dir, "lanechange")
+events_file = os.path.join(output_base_dir, "lanechange", "LaneChange_Events.parquet")
+aggregates_file = os.path.join(output_base_dir, "lanechange", "LaneChange_Aggregates.xlsx")
+
+EGO_ID = "v_0"
+
+# Seconds before/after each ego lane change in which neighbour lane changes are counted
+NEIGHBOUR_WINDOW = 5.0
+
+# String attributes of a <change> element, stored as categorical codes
+CATEGORICAL_COLUMNS = ["id", "type", "from", "to", "reason"]
+
+# Numeric attributes of a <change> element; "None" (no leader/follower) becomes NaN
+NUMERIC_COLUMNS = ["time", "dir", "speed", "pos", "leaderGap", "leaderSecureGap",
+                   "followerGap", "followerSecureGap", "origLeaderGap", "origLeaderSecureGap", "latGap"]
+
+PARAMETER_COLUMNS = ["route_", "lcSigma", "tau", "actionStepLength", "minGapLat"]
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def extract_events(xml_folder):
+    """Stream every <change> element of every lanechange file into a columnar event table.
+
+    Strings are interned into per-column category lists while parsing and numbers go
+    into typed arrays, so memory stays proportional to the number of events. Returns
+    (events, runs): one row per lane change with a "run" index, and one row per file.
+    """
+    categories = {column: {} for column in CATEGORICAL_COLUMNS}
+    codes = {column: array("i") for column in CATEGORICAL_COLUMNS}
+    values = {column: array("d") for column in NUMERIC_COLUMNS}
+    run_codes = array("i")
+    run_files = []
+
+    for xml_file in sorted(os.listdir(xml_folder)):
+        if not xml_file.endswith(".xml"):
+            continue
+        xml_path = os.path.join(xml_folder, xml_file)
+        run = len(run_files)
+        parsed = 0
+        try:
+            context = ET.iterparse(xml_path, events=("start", "end"))
+            _, root = next(context)
+            for event, elem in context:
+                if event != "end" or elem.tag != "change":
+                    continue
+                attrib = elem.attrib
+                for column in CATEGORICAL_COLUMNS:
+                    lookup = categories[column]
+                    value = attrib.get(column, "")
+                    code = lookup.get(value)
+                    if code is None:
+                        code = lookup[value] = len(lookup)
+                    codes[column].append(code)
+                for column in NUMERIC_COLUMNS:
+                    values[column].append(_to_float(attrib.get(column)))
+                run_codes.append(run)
+                parsed += 1
+                # Drop parsed elements from the root so memory does not grow with the file
+                root.clear()
+        except ET.ParseError as e:
+            # Keep the events read before the error (e.g. a run killed mid-write)
+            logging.error(f"Error parsing file {xml_file} after {parsed} events: {e}")
+        except Exception as e:
+            logging.error(f"Unexpected error processing file {xml_file}: {e}")
+        run_files.append(xml_file)
+
+    events = pd.DataFrame({"run": np.frombuffer(run_codes, dtype=np.int32)})
+    for column in CATEGORICAL_COLUMNS:
+        events[column] = pd.Categorical.from_codes(np.frombuffer(codes[column], dtype=np.int32),
+                                                   categories=list(categories[column]))
+    for column in NUMERIC_COLUMNS:
+        events[column] = np.frombuffer(values[column], dtype=np.float64).astype(np.float32)
+
+    runs = pd.DataFrame({"File": run_files})
+    for param in PARAMETER_COLUMNS:
+        # Values are kept as strings, like the other compile scripts
+        runs[param] = runs["File"].str.extract(re.escape(param) + r"(-?\d+\.\d+|-?\d+)", expand=False).fillna("N/A")
+    return events, runs
+
+def aggregate_runs(events, runs, ego_id=EGO_ID, window=NEIGHBOUR_WINDOW):
+    """Compute per-run lane-change aggregates with group operations on the event table."""
+    by_run = events.groupby("run", observed=True)
+    aggregates = pd.DataFrame({
+        "n_lane_changes": by_run.size(),
+        "n_vehicles": by_run["id"].nunique()
+    })
+    aggregates["lane_changes_per_vehicle"] = aggregates["n_lane_changes"] / aggregates["n_vehicles"]
+
+    reasons = pd.crosstab(events["run"], events["reason"])
+    reasons.columns = [f"reason_{reason}" for reason in reasons.columns]
+    aggregates = aggregates.join(reasons)
+
+    is_ego = events["id"] == ego_id
+    ego = events[is_ego]
+    ego_aggregates = ego.groupby("run").agg(
+        ego_lane_changes=("time", "size"),
+        ego_min_leaderGap=("leaderGap", "min"),
+        ego_min_followerGap=("followerGap", "min"),
+        ego_min_latGap=("latGap", "min")
+    )
+    aggregates = aggregates.join(ego_aggregates)
+
+    # Lane changes of other vehicles into the ego's target lane around each ego lane change
+    ego_keys = ego[["run", "to", "time"]].assign(to=ego["to"].astype(str))
+    others = events.loc[~is_ego, ["run", "to", "time", "leaderGap", "followerGap"]]
+    others = others.assign(to=others["to"].astype(str)).reset_index(names="event")
+    pairs = ego_keys.merge(others, on=["run", "to"], suffixes=("_ego", ""))
+    pairs = pairs[np.abs(pairs["time"].to_numpy() - pairs["time_ego"].to_numpy()) <= window]
+    pairs = pairs.drop_duplicates("event")
+    neighbour_aggregates = pairs.groupby("run").agg(
+        neighbour_lane_changes=("event", "size"),
+        neighbour_min_leaderGap=("leaderGap", "min"),
+        neighbour_min_followerGap=("followerGap", "min")
+    )
+    aggregates = runs.join(aggregates.join(neighbour_aggregates), how="left")
+
+    # Runs without any (ego/neighbour) lane change get zero counts instead of NaN
+    count_columns = ["n_lane_changes", "n_vehicles", "ego_lane_changes", "neighbour_lane_changes"] + \
+                    [c for c in aggregates.columns if c.startswith("reason_")]
+    aggregates[count_columns] = aggregates[count_columns].fillna(0).astype(int)
+    # Gaps are stored as float32; widen them before rounding, since rounding a float32
+    # column keeps the conversion noise (20.2 -> 20.200001)
+    float32_columns = aggregates.select_dtypes("float32").columns
+    aggregates[float32_columns] = aggregates[float32_columns].astype("float64")
+    return aggregates.round(3)
+
+def save_events(events, runs, events_file):
+    """Save the event table as Parquet, falling back to compressed CSV without pyarrow."""
+    table = events.assign(File=pd.Categorical.from_codes(events["run"], categories=runs["File"]))
+    try:
+        table.to_parquet(events_file, index=False)
+        return events_file
+    except ImportError:
+        csv_file = os.path.splitext(events_file)[0] + ".csv.gz"
+        table.to_csv(csv_file, index=False)
+        return csv_file
+
+def main():
+    if not os.path.isdir(xml_folder):
+        print(f"Error: lanechange folder '{xml_folder}' does not exist.")
+        return
+    events, runs = extract_events(xml_folder)
+    if events.empty:
+        print("No data extracted. Please check your XML files or folder path.")
+        return
+
+    saved_file = save_events(events, runs, events_file)
+    print(f"{len(events)} lane-change events from {len(runs)} runs saved to {saved_file}")
+
+    aggregates = aggregate_runs(events, runs)
+    try:
+        aggregates.to_excel(aggregates_file, index=False)
+        print(f"Per-run lane-change aggregates saved to {aggregates_file}")
+    except Exception as e:
+        logging.error(f"Error saving data to Excel file: {e}")
+        print(f"Error saving data to Excel file: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -77,8 +77,9 @@ def process_xml_files(input_dir, output_file):
     wb.save(output_file)
     print(f"Processed {ws.max_row - 1} files. Output saved to {output_file}")
 
-# Example usage
-input_directory = r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Route_files'  # Current directory (where the script runs)
-output_excel = r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Route_files\Compiled_Route_Data.xlsx'
+# Example usage (SIM_OUTPUT_DIR overrides the default sweep output directory)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new')
+input_directory = os.path.join(output_base_dir, "Route_files")
+output_excel = os.path.join(output_base_dir, "Route_files", "Compiled_Route_Data.xlsx")
 
 process_xml_files(input_directory, output_excel)
\ No newline at end of file
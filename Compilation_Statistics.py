@@ -2,9 +2,10 @@ import os
 import xml.etree.ElementTree as ET
 import pandas as pd
 
-# Define the folder containing XML files and the output directory
-xml_folder = r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Statistics'  # Replace with the path to your folder
-output_dir = r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Statistics'  # Replace with your desired output directory
+# Define the folder containing XML files and the output directory (SIM_OUTPUT_DIR overrides the default)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r'C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new')
+xml_folder = os.path.join(output_base_dir, "Statistics")
+output_dir = os.path.join(output_base_dir, "Statistics")
 
 # Ensure the output directory exists
 os.makedirs(output_dir, exist_ok=True)
@@ -8,9 +8,10 @@ import re
 logging.basicConfig(filename='xml_processing.log', level=logging.ERROR, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Hardcoded input and output paths
-xml_folder = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Tripinfo"
-output_file = r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new\Tripinfo\Compiled.xlsx"
+# Input and output paths (SIM_OUTPUT_DIR overrides the default sweep output directory)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new")
+xml_folder = os.path.join(output_base_dir, "Tripinfo")
+output_file = os.path.join(output_base_dir, "Tripinfo", "Compiled.xlsx")
 
 # Ensure the output file has a valid extension (e.g., .xlsx)
 if not output_file.lower().endswith('.xlsx'):
@@ -60,22 +61,22 @@ for xml_file in os.listdir(xml_folder):
         xml_path = os.path.join(xml_folder, xml_file)
         
         try:
-            # Parse the XML file
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
-            
-            # Extract the first row (header) - from the first child element
-            if not header_added and len(root) > 0:
-                header_row = list(root[0].attrib.keys())
-                # Add headers for the additional columns
-                combined_data.append(["File", "route_", "lcSigma", "tau", "actionStepLength", "minGapLat"] + header_row)
-                header_added = True
-            
-            # Extract the row with id="v_0"
+            # Stream the XML file and stop at the row with id="v_0", so the rest of the
+            # file is never read
             v_0_row = None
-            for child in root:
-                if child.attrib.get("id") == "v_0":
-                    v_0_row = list(child.attrib.values())
+            for _, elem in ET.iterparse(xml_path, events=("start",)):
+                if elem.tag != "tripinfo":
+                    continue
+                
+                # Extract the first row (header) - from the first element
+                if not header_added:
+                    header_row = list(elem.attrib.keys())
+                    # Add headers for the additional columns
+                    combined_data.append(["File", "route_", "lcSigma", "tau", "actionStepLength", "minGapLat"] + header_row)
+                    header_added = True
+                
+                if elem.attrib.get("id") == "v_0":
+                    v_0_row = list(elem.attrib.values())
                     break
             
             # If the row with id="v_0" exists, add it to the combined data
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+
+from Automation import run_simulation, STATUS_SUCCESS, RETRY_STATUSES
+from Instrumentation import ProgressTracker
+
+# Queue states of a run
+QUEUE_PENDING = "pending"
+QUEUE_RUNNING = "running"
+QUEUE_DONE = "done"
+QUEUE_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_file TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated REAL,
+    limits TEXT,
+    max_attempts INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_state ON runs (state, id);
+"""
+
+def connect(db_path, busy_timeout=60):
+    """Open the shared queue database.
+
+    The default rollback journal is used instead of WAL because WAL does not work on
+    network filesystems. Transactions are managed explicitly (BEGIN IMMEDIATE) so that
+    claiming a run is atomic across processes and hosts. `busy_timeout` is how long (s)
+    a statement waits for a lock held by another process.
+    """
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    # Queue files created before the watchdog limits were stored with the runs
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(runs)")]
+    for column, column_type in [("limits", "TEXT"), ("max_attempts", "INTEGER")]:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+    return conn
+
+def publish_runs(db_path, config_files, limits=None, max_attempts=None):
+    """Add configuration files to the queue; files already queued are left untouched.
+
+    `limits` ({"timeout", "timeout_factor", "max_rss_mb"}, as for Automation.run_simulation)
+    and `max_attempts` are stored with every run, so all workers apply the watchdog settings
+    of the sweep; workers use their own settings only for runs published without them.
+    """
+    limits_json = json.dumps(limits) if limits is not None else None
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO runs (config_file, updated, limits, max_attempts) "
+                         "VALUES (?, ?, ?, ?)",
+                         [(os.path.abspath(c), time.time(), limits_json, max_attempts) for c in config_files])
+        published = conn.total_changes - before
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    print(f"Published {published} runs to {db_path}")
+    return published
+
+def requeue_expired(conn, max_attempts):
+    """Return runs whose lease expired to the queue, or fail them once attempts are used up.
+
+    `max_attempts` applies to runs published without their own max_attempts.
+    """
+    now = time.time()
+    conn.execute("UPDATE runs SET state = ?, worker = NULL, lease_expires = NULL, updated = ? "
+                 "WHERE state = ? AND lease_expires < ? AND attempts < COALESCE(max_attempts, ?)",
+                 (QUEUE_PENDING, now, QUEUE_RUNNING, now, max_attempts))
+    conn.execute("UPDATE runs SET state = ?, lease_expires = NULL, updated = ?, result = ? "
+                 "WHERE state = ? AND lease_expires < ? AND attempts >= COALESCE(max_attempts, ?)",
+                 (QUEUE_FAILED, now, json.dumps({"status": "lease_expired"}),
+                  QUEUE_RUNNING, now, max_attempts))
+
+def claim_run(conn, worker_id, lease_seconds, max_attempts):
+    """Atomically claim the next pending run; returns (id, config_file, limits) or None.
+
+    limits is the dict stored by publish_runs, or None for runs published without limits.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        requeue_expired(conn, max_attempts)
+        row = conn.execute("SELECT id, config_file, limits FROM runs WHERE state = ? ORDER BY id LIMIT 1",
+                           (QUEUE_PENDING,)).fetchone()
+        if row is not None:
+            now = time.time()
+            conn.execute("UPDATE runs SET state = ?, worker = ?, lease_expires = ?, "
+                         "attempts = attempts + 1, updated = ? WHERE id = ?",
+                         (QUEUE_RUNNING, worker_id, now + lease_seconds, now, row["id"]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return row["id"], row["config_file"], json.loads(row["limits"]) if row["limits"] else None
+
+def renew_lease(conn, run_id, worker_id, lease_seconds):
+    """Extend the lease of a run held by this worker; returns False if the lease was lost."""
+    cursor = conn.execute("UPDATE runs SET lease_expires = ?, updated = ? "
+                          "WHERE id = ? AND worker = ? AND state = ?",
+                          (time.time() + lease_seconds, time.time(), run_id, worker_id, QUEUE_RUNNING))
+    return cursor.rowcount == 1
+
+def complete_run(conn, run_id, worker_id, result, max_attempts):
+    """Report the result of a run.
+
+    Runs that failed with a status in RETRY_STATUSES go back to the queue until attempts are
+    used up; other failures (timeout, oom, sumo_error) would fail the same way again and fail
+    at once.
+    """
+    if result["status"] == STATUS_SUCCESS:
+        state_sql = "?"
+        params = [QUEUE_DONE]
+    elif result["status"] in RETRY_STATUSES:
+        state_sql = "CASE WHEN attempts < COALESCE(max_attempts, ?) THEN ? ELSE ? END"
+        params = [max_attempts, QUEUE_PENDING, QUEUE_FAILED]
+    else:
+        state_sql = "?"
+        params = [QUEUE_FAILED]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(f"UPDATE runs SET state = {state_sql}, worker = NULL, lease_expires = NULL, "
+                              "result = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                              params + [json.dumps(result), time.time(), run_id, worker_id, QUEUE_RUNNING])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount == 1
+
+def queue_counts(conn):
+    """Return the number of runs in each queue state."""
+    counts = {QUEUE_PENDING: 0, QUEUE_RUNNING: 0, QUEUE_DONE: 0, QUEUE_FAILED: 0}
+    for row in conn.execute("SELECT state, COUNT(*) AS n FROM runs GROUP BY state"):
+        counts[row["state"]] = row["n"]
+    return counts
+
+def _heartbeat(db_path, run_id, worker_id, lease_seconds, stop_event, lease_lost):
+    """Renew the lease of a running run until stop_event is set.
+
+    Sets lease_lost when another worker took the run over, or when no renewal has succeeded
+    for half the lease, so the run is killed well before the lease expires and anyone else
+    can claim it. The connection waits at most a sixth of the lease for a lock, so a blocked
+    renewal cannot hold the heartbeat past that point. Lease expiry times are written and
+    compared with each host's own clock (time.time()), so the clocks of all hosts must agree
+    to well within half the lease.
+    """
+    conn = connect(db_path, busy_timeout=lease_seconds / 6)
+    fence_after = lease_seconds / 2
+    renewed = time.monotonic()
+    try:
+        while not stop_event.wait(max(min(lease_seconds / 3, renewed + fence_after - time.monotonic()), 0)):
+            attempt = time.monotonic()
+            if attempt - renewed >= fence_after:
+                print(f"Worker {worker_id} could not renew the lease on run {run_id} in time")
+                lease_lost.set()
+                return
+            try:
+                if not renew_lease(conn, run_id, worker_id, lease_seconds):
+                    print(f"Worker {worker_id} lost the lease on run {run_id}")
+                    lease_lost.set()
+                    return
+                # The new expiry is counted from no earlier than the start of the attempt
+                renewed = attempt
+            except sqlite3.Error as e:
+                print(f"Worker {worker_id} failed to renew the lease on run {run_id}: {e}")
+    finally:
+        conn.close()
+
+def _output_files(config_file):
+    """Return the output files a SUMO configuration writes."""
+    try:
+        root = ET.parse(config_file).getroot()
+    except (ET.ParseError, OSError):
+        return []
+    return [elem.get("value") for elem in root.iter()
+            if elem.tag.endswith("-output") and elem.get("value")]
+
+def discard_outputs(conn, run_id, worker_id, config_file):
+    """Delete the outputs of a run whose lease was lost, unless another worker now holds the run.
+
+    A run held by another worker writes to the same files, so they are left to that worker.
+    """
+    row = conn.execute("SELECT state, worker FROM runs WHERE id = ?", (run_id,)).fetchone()
+    if row is not None and row["state"] == QUEUE_RUNNING and row["worker"] != worker_id:
+        print(f"Run {run_id} is now held by {row['worker']}; its outputs are left in place")
+        return 0
+    removed = 0
+    for path in _output_files(config_file):
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+    return removed
+
+def worker_loop(db_path, worker_id=None, lease_seconds=60, max_attempts=3, poll_interval=2.0,
+                exit_when_idle=True, timeout=None, timeout_factor=None, max_rss_mb=None):
+    """Claim and run queued simulations until the queue is drained (or forever).
+
+    Runs use the watchdog limits and max_attempts they were published with; the worker's
+    own timeout, timeout_factor, max_rss_mb and max_attempts apply to runs published without.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    conn = connect(db_path)
+    completed = 0
+    try:
+        while True:
+            claimed = claim_run(conn, worker_id, lease_seconds, max_attempts)
+            if claimed is None:
+                counts = queue_counts(conn)
+                if exit_when_idle and counts[QUEUE_PENDING] == 0 and counts[QUEUE_RUNNING] == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            run_id, config_file, limits = claimed
+            if limits is None:
+                limits = {"timeout": timeout, "timeout_factor": timeout_factor, "max_rss_mb": max_rss_mb}
+            stop_event = threading.Event()
+            lease_lost = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, daemon=True,
+                                         args=(db_path, run_id, worker_id, lease_seconds, stop_event, lease_lost))
+            heartbeat.start()
+            try:
+                # Losing the lease kills the run, so it never writes alongside the worker that took it over
+                result = run_simulation(config_file, limits.get("timeout"), limits.get("timeout_factor"),
+                                        limits.get("max_rss_mb"), stop_event=lease_lost)
+            finally:
+                stop_event.set()
+                heartbeat.join()
+            result["worker"] = worker_id
+            if lease_lost.is_set():
+                discard_outputs(conn, run_id, worker_id, config_file)
+                print(f"Result of run {run_id} discarded: the lease was lost")
+            elif not complete_run(conn, run_id, worker_id, result, max_attempts):
+                print(f"Result of run {run_id} discarded: lease was taken over by another worker")
+            completed += 1
+    finally:
+        conn.close()
+    print(f"Worker {worker_id} finished after {completed} runs")
+    return completed
+
+def wait_for_queue(db_path, poll_interval=5.0, recorder=None):
+    """Block until no run is pending or running, printing progress; returns the final counts."""
+    conn = connect(db_path)
+    try:
+        counts = queue_counts(conn)
+        progress = ProgressTracker(sum(counts.values()), recorder, stage="distributed_runs")
+        finished = counts[QUEUE_DONE] + counts[QUEUE_FAILED]
+        progress.done = finished
+        while counts[QUEUE_PENDING] or counts[QUEUE_RUNNING]:
+            time.sleep(poll_interval)
+            counts = queue_counts(conn)
+            newly_finished = counts[QUEUE_DONE] + counts[QUEUE_FAILED] - finished
+            if newly_finished > 0:
+                finished += newly_finished
+                progress.update(queue_depth=counts[QUEUE_PENDING], count=newly_finished)
+    finally:
+        conn.close()
+    print("Queue drained: " + ", ".join(f"{state}={n}" for state, n in counts.items()))
+    return counts
+
+def _collect_config_files(paths):
+    config_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            config_files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                                if f.endswith(".sumocfg"))
+        else:
+            config_files.append(path)
+    return config_files
+
+def _publish_kwargs(args):
+    return {"limits": {"timeout": args.timeout, "timeout_factor": args.timeout_factor,
+                       "max_rss_mb": args.max_rss_mb},
+            "max_attempts": args.max_attempts}
+
+def _worker_kwargs(args):
+    return {"lease_seconds": args.lease, "max_attempts": args.max_attempts,
+            "timeout": args.timeout, "timeout_factor": args.timeout_factor,
+            "max_rss_mb": args.max_rss_mb}
+
+def main():
+    parser = argparse.ArgumentParser(description="Spread a SUMO sweep over several hosts through a shared SQLite queue.")
+    parser.add_argument("--db", required=True, help="Queue database on storage shared by all hosts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="Queue .sumocfg files (or directories of them)")
+    publish_parser.add_argument("configs", nargs="+")
+
+    worker_parser = subparsers.add_parser("worker", help="Run queued simulations on this host")
+    worker_parser.add_argument("--processes", type=int, default=1, help="Worker processes on this host")
+    worker_parser.add_argument("--forever", action="store_true", help="Keep polling when the queue is empty")
+
+    local_parser = subparsers.add_parser("local", help="Publish and run with N worker processes on this host")
+    local_parser.add_argument("configs", nargs="+")
+    local_parser.add_argument("--processes", type=int, default=4)
+
+    subparsers.add_parser("status", help="Print the number of runs in each state")
+    subparsers.add_parser("wait", help="Wait until all queued runs are finished")
+
+    for sub in (worker_parser, local_parser):
+        sub.add_argument("--lease", type=float, default=60,
+                         help="Lease length in seconds (host clocks must agree to well within half of it)")
+    # publish/local store these with the runs; a worker applies its own only to runs published without
+    for sub in (publish_parser, worker_parser, local_parser):
+        sub.add_argument("--max-attempts", type=int, default=3, help="Attempts per run across all workers (runs killed from outside the watchdog)")
+        sub.add_argument("--timeout", type=float, default=None, help="Per-run wall-clock limit in seconds")
+        sub.add_argument("--timeout-factor", type=float, default=None,
+                         help="Per-run limit as a multiple of the scenario end time")
+        sub.add_argument("--max-rss-mb", type=float, default=None, help="Per-run memory limit")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        publish_runs(args.db, _collect_config_files(args.configs), **_publish_kwargs(args))
+    elif args.command == "status":
+        conn = connect(args.db)
+        print(", ".join(f"{state}={n}" for state, n in queue_counts(conn).items()))
+        conn.close()
+    elif args.command == "wait":
+        wait_for_queue(args.db)
+    else:
+        if args.command == "local":
+            publish_runs(args.db, _collect_config_files(args.configs), **_publish_kwargs(args))
+        kwargs = _worker_kwargs(args)
+        kwargs["exit_when_idle"] = not getattr(args, "forever", False)
+        processes = [multiprocessing.Process(target=worker_loop, args=(args.db,), kwargs=kwargs)
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if args.command == "local":
+            conn = connect(args.db)
+            counts = queue_counts(conn)
+            conn.close()
+            print("Queue drained: " + ", ".join(f"{state}={n}" for state, n in counts.items()))
+            return 1 if counts[QUEUE_FAILED] else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
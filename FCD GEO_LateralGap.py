@@ -1,6 +1,7 @@
 import xml.etree.ElementTree as ET
 import pandas as pd
 import math
+import os
 
 def haversine(lon1, lat1, lon2, lat2):
     """
@@ -20,8 +21,12 @@ def haversine(lon1, lat1, lon2, lat2):
     r = 6371 * 1000
     return c * r
 
+# Input and output paths (SIM_FCD_FILE and SIM_FCD_OUTPUT override the defaults)
+fcd_file = os.environ.get("SIM_FCD_FILE", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Lateral\Lateral Scenario1\Output\fcd.xml")
+output_excel = os.environ.get("SIM_FCD_OUTPUT", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Lateral\Lateral Scenario1\Output\Output1.xlsx")
+
 # Load the FCD XML file
-tree = ET.parse(r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Lateral\Lateral Scenario1\Output\fcd.xml")
+tree = ET.parse(fcd_file)
 root = tree.getroot()
 
 # Create a list to hold all vehicle states
@@ -61,6 +66,6 @@ for timestep in root.findall('timestep'):
 
 # Create DataFrame and save to Excel
 output_df = pd.DataFrame(vehicle_states)
-output_df.to_excel(r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Lateral\Lateral Scenario1\Output\Output1.xlsx", index=False)
+output_df.to_excel(output_excel, index=False)
 
-print("Done! Lateral gaps (in meters) saved to Output1.xlsx")
\ No newline at end of file
+print(f"Done! Lateral gaps (in meters) saved to {output_excel}")
\ No newline at end of file
@@ -0,0 +1,379 @@
+import os
+import re
+import argparse
+import logging
+import xml.etree.ElementTree as ET
+from array import array
+import numpy as np
+import pandas as pd
+
+# Set up logging
+logging.basicConfig(filename='xml_processing.log', level=logging.ERROR,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Input and output paths (SIM_OUTPUT_DIR overrides the default sweep output directory)
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new")
+fcd_folder = os.path.join(output_base_dir, "Fcd")
+output_file = os.path.join(output_base_dir, "Fcd", "Surrogate_Safety.xlsx")
+route_folder = os.path.join(output_base_dir, "Route_files")
+
+EGO_ID = "v_0"
+
+# Vehicles further than this from the ego (m) are not considered neighbours
+NEIGHBOUR_RADIUS = 50.0
+
+# Vehicle length and width (m) used when neither the FCD nor the vTypes give them (SUMO's defaults)
+DEFAULT_LENGTH = 5.0
+DEFAULT_WIDTH = 1.8
+
+# Grid cell size (m) used to find the conflict areas for PET
+PET_CELL_SIZE = 1.0
+
+# Largest PET (s) reported; cell occupancy that ended longer ago than this cannot give a
+# reported PET any more and is dropped, which keeps memory bounded on long runs
+PET_HORIZON = 10.0
+
+# In a grid cell both the ego and a neighbour covered, the neighbour encroached on the ego's path
+# if its heading there differs from the ego's by more than ENCROACHMENT_ANGLE (degrees), or if
+# its centreline is more than ENCROACHMENT_OFFSET (m) to the side of the ego's while their
+# bodies still overlap laterally; otherwise it was following in the ego's track
+ENCROACHMENT_ANGLE = 10.0
+ENCROACHMENT_OFFSET = 0.5
+
+# Number of timesteps processed together as one block of NumPy arrays
+WINDOW_STEPS = 1000
+
+PARAMETER_COLUMNS = ["route_", "lcSigma", "tau", "actionStepLength", "minGapLat"]
+
+def extract_parameters_from_filename(filename):
+    """Extract routeID, lcSigma, tau, actionStepLength, and minGapLat from the file name."""
+    params = {}
+    for key, value in re.findall(r"(route_|lcSigma|tau|actionStepLength|minGapLat)(-?\d+\.\d+|-?\d+)", filename):
+        params[key] = value
+    return {key: params.get(key, "N/A") for key in PARAMETER_COLUMNS}
+
+def load_vtype_dimensions(route_file):
+    """Return {vType id: (length, width)} for the vTypes of a SUMO route file."""
+    dimensions = {}
+    for vtype in ET.parse(route_file).getroot().iter("vType"):
+        dimensions[vtype.get("id")] = (float(vtype.get("length", DEFAULT_LENGTH)),
+                                       float(vtype.get("width", DEFAULT_WIDTH)))
+    return dimensions
+
+def _velocity(speed, angle):
+    """SUMO angles are in degrees, clockwise from north."""
+    radians = np.radians(angle)
+    return speed * np.sin(radians), speed * np.cos(radians)
+
+def _overlap_times(position, speed, low, high):
+    """Return the first and last time t >= 0 with low < position + speed * t < high (empty if first >= last)."""
+    inside = (position > low) & (position < high)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_low = (low - position) / speed
+        t_high = (high - position) / speed
+    first = np.where(speed > 0, t_low, np.where(speed < 0, t_high, np.where(inside, 0.0, np.inf)))
+    last = np.where(speed > 0, t_high, np.where(speed < 0, t_low, np.where(inside, np.inf, -np.inf)))
+    return np.maximum(first, 0.0), last
+
+def pair_metrics(dx, dy, dvx, dvy, ego_angle, ego_length, ego_width, length, width):
+    """Vectorized gap-based TTC and DRAC for arrays of ego-neighbour pairs.
+
+    dx/dy and dvx/dvy are the neighbour's position and velocity relative to the ego. SUMO
+    positions are the centre of the front bumper, so each body is a rectangle of the vehicle's
+    length and width behind that point, aligned with the ego's heading. TTC is the time until
+    the bodies overlap at constant velocities (0 if they already do, inf if never). DRAC is
+    the deceleration the following vehicle needs to cancel the closing speed within the
+    bumper-to-bumper gap, for neighbours directly ahead of or behind the ego.
+    """
+    heading_x, heading_y = _velocity(1.0, ego_angle)
+    # Longitudinal (positive ahead) and lateral (positive to the right) components in the ego's frame
+    s, ds = dx * heading_x + dy * heading_y, dvx * heading_x + dvy * heading_y
+    d, dd = dx * heading_y - dy * heading_x, dvx * heading_y - dvy * heading_x
+    half_width = (ego_width + width) / 2
+
+    # The bodies overlap longitudinally while -ego_length < s < length and laterally while |d| < half_width
+    long_first, long_last = _overlap_times(s, ds, -ego_length, length)
+    lat_first, lat_last = _overlap_times(d, dd, -half_width, half_width)
+    first = np.maximum(long_first, lat_first)
+    ttc = np.where(first < np.minimum(long_last, lat_last), first, np.inf)
+
+    in_path = np.abs(d) < half_width
+    ahead = s >= length
+    gap = np.where(ahead, s - length, -ego_length - s)
+    closing_speed = np.where(ahead, -ds, ds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drac = np.where(in_path & (closing_speed > 0) & (gap > 0), closing_speed ** 2 / (2 * gap), 0.0)
+    return ttc, drac
+
+def cell_occupancy(vid, step, time, x, y, angle, length, width, cell_size=PET_CELL_SIZE):
+    """First and last time each vehicle covers each grid cell, and how it crossed the cell.
+
+    The front and rear edges of each body are swept at half-cell spacing along the straight
+    path between consecutive samples of a vehicle, so the cells a vehicle passes through do
+    not depend on the simulation step length. Each cell also gets the sums of the vehicle's
+    centreline position and heading over the swept points (with their count, so windows
+    merge exactly), which post_encroachment_time compares with the ego's.
+    """
+    order = np.lexsort((step, vid))
+    vid, step, time, x, y, angle, length, width = (
+        a[order] for a in (vid, step, time, x, y, angle, length, width))
+
+    # Path segment from each sample to the vehicle's next one (or to itself for its last sample)
+    following = np.minimum(np.arange(1, len(vid) + 1), len(vid) - 1)
+    end = np.where((vid[following] == vid) & (step[following] == step + 1), following, np.arange(len(vid)))
+    spacing = cell_size / 2
+    n = np.maximum(np.ceil(np.hypot(x[end] - x, y[end] - y) / spacing), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(vid)), n + 1)
+    fraction = (np.arange(len(segment)) - np.repeat(np.cumsum(n + 1) - (n + 1), n + 1)) / np.repeat(n, n + 1)
+    later = end[segment]
+    px = x[segment] + fraction * (x[later] - x[segment])
+    py = y[segment] + fraction * (y[later] - y[segment])
+    pt = time[segment] + fraction * (time[later] - time[segment])
+
+    # Points across the front edge (0 m back) and the rear edge (length back) of every pose
+    heading_x, heading_y = _velocity(1.0, angle[segment])
+    offsets = np.linspace(-0.5, 0.5, int(np.ceil(width.max() / spacing)) + 1)
+    lateral = (width[segment][:, None] * offsets)[:, None, :]
+    back = np.stack([np.zeros(len(segment)), length[segment]], axis=1)[:, :, None]
+    ex = px[:, None, None] - back * heading_x[:, None, None] + lateral * heading_y[:, None, None]
+    ey = py[:, None, None] - back * heading_y[:, None, None] - lateral * heading_x[:, None, None]
+
+    shape = ex.shape
+    frame = pd.DataFrame({
+        "cx": np.floor(ex.ravel() / cell_size).astype(np.int64),
+        "cy": np.floor(ey.ravel() / cell_size).astype(np.int64),
+        "vid": np.broadcast_to(vid[segment][:, None, None], shape).ravel(),
+        "time": np.broadcast_to(pt[:, None, None], shape).ravel(),
+        "x": np.broadcast_to(px[:, None, None] - back * heading_x[:, None, None], shape).ravel(),
+        "y": np.broadcast_to(py[:, None, None] - back * heading_y[:, None, None], shape).ravel(),
+        "hx": np.broadcast_to(heading_x[:, None, None], shape).ravel(),
+        "hy": np.broadcast_to(heading_y[:, None, None], shape).ravel(),
+        "width": np.broadcast_to(width[segment][:, None, None], shape).ravel()
+    })
+    return frame.groupby(["cx", "cy", "vid"]).agg(
+        min=("time", "min"), max=("time", "max"), sum_x=("x", "sum"), sum_y=("y", "sum"),
+        sum_hx=("hx", "sum"), sum_hy=("hy", "sum"), points=("time", "size"), width=("width", "max")).reset_index()
+
+# How the occupancy of two windows is merged
+OCCUPANCY_MERGE = {"min": "min", "max": "max", "sum_x": "sum", "sum_y": "sum",
+                   "sum_hx": "sum", "sum_hy": "sum", "points": "sum", "width": "max"}
+
+class _RunState:
+    """Running extremes of one FCD file and the cell occupancy still relevant for PET."""
+
+    def __init__(self):
+        self.min_ttc = (np.inf, np.nan, -1)     # (value, time, neighbour code)
+        self.max_drac = (0.0, np.nan, -1)
+        self.min_pet = (np.inf, -1)             # (value, neighbour code)
+        self.intervals = None                   # cell occupancy intervals within the PET horizon
+
+    def update(self, name, value, time, neighbour, smaller):
+        current = getattr(self, name)
+        if (value < current[0]) if smaller else (value > current[0]):
+            setattr(self, name, (value, time, neighbour))
+
+    def add_occupancy(self, occupancy, ego_code, window_end, horizon,
+                      offset=ENCROACHMENT_OFFSET, angle=ENCROACHMENT_ANGLE):
+        """Merge a window's occupancy, update the minimum PET and drop intervals that ended too
+        long before the window end to give a smaller PET within the horizon."""
+        if self.intervals is not None:
+            occupancy = pd.concat([self.intervals, occupancy]).groupby(["cx", "cy", "vid"]).agg(
+                OCCUPANCY_MERGE).reset_index()
+        pet, vehicle = post_encroachment_time(occupancy, ego_code, offset, angle)
+        if pet < self.min_pet[0]:
+            self.min_pet = (pet, vehicle)
+        self.intervals = occupancy[occupancy["max"] >= window_end - min(horizon, self.min_pet[0])]
+
+def process_window(columns, ego_code, state, radius=NEIGHBOUR_RADIUS, cell_size=PET_CELL_SIZE,
+                   encroachment_offset=ENCROACHMENT_OFFSET, encroachment_angle=ENCROACHMENT_ANGLE,
+                   pet_horizon=PET_HORIZON):
+    """Compute ego-neighbour metrics for one window of timesteps held as NumPy arrays."""
+    step = np.frombuffer(columns["step"], dtype=np.int64)
+    if len(step) == 0:
+        return
+    time = np.frombuffer(columns["time"], dtype=np.float64)
+    vid = np.frombuffer(columns["vid"], dtype=np.int32)
+    x = np.frombuffer(columns["x"], dtype=np.float64)
+    y = np.frombuffer(columns["y"], dtype=np.float64)
+    angle = np.frombuffer(columns["angle"], dtype=np.float64)
+    length = np.frombuffer(columns["length"], dtype=np.float64)
+    width = np.frombuffer(columns["width"], dtype=np.float64)
+    vx, vy = _velocity(np.frombuffer(columns["speed"], dtype=np.float64), angle)
+
+    # Map every row to the ego row of the same timestep
+    step = step - step[0]
+    is_ego = vid == ego_code
+    ego_rows = np.nonzero(is_ego)[0]
+    if len(ego_rows) == 0:
+        return
+    ego_row = np.full(step[-1] + 1, -1, dtype=np.int64)
+    ego_row[step[is_ego]] = ego_rows
+    partner = ego_row[step]
+    rows = np.nonzero((partner >= 0) & ~is_ego)[0]
+    ego = partner[rows]
+
+    dx, dy = x[rows] - x[ego], y[rows] - y[ego]
+    near = dx * dx + dy * dy <= radius * radius
+    rows, ego, dx, dy = rows[near], ego[near], dx[near], dy[near]
+    if len(rows) > 0:
+        ttc, drac = pair_metrics(dx, dy, vx[rows] - vx[ego], vy[rows] - vy[ego],
+                                 angle[ego], length[ego], width[ego], length[rows], width[rows])
+        i = np.argmin(ttc)
+        state.update("min_ttc", ttc[i], time[rows[i]], vid[rows[i]], smaller=True)
+        i = np.argmax(drac)
+        state.update("max_drac", drac[i], time[rows[i]], vid[rows[i]], smaller=False)
+
+    # Cell occupancy of the ego and of the neighbours near it
+    occupied = np.concatenate([ego_rows, rows])
+    occupancy = cell_occupancy(vid[occupied], step[occupied], time[occupied], x[occupied], y[occupied],
+                               angle[occupied], length[occupied], width[occupied], cell_size)
+    state.add_occupancy(occupancy, ego_code, time[-1], pet_horizon, encroachment_offset, encroachment_angle)
+
+def post_encroachment_time(intervals, ego_code, offset=ENCROACHMENT_OFFSET, angle=ENCROACHMENT_ANGLE):
+    """Minimum PET between the ego and any neighbour that encroached on a cell of the ego's path.
+
+    PET is the gap between one vehicle leaving a cell and the other entering it. A shared
+    cell only counts if the neighbour crossed it at an angle to the ego's heading there, or
+    off to the side of the ego's centreline (see ENCROACHMENT_OFFSET), in the ego's frame at
+    that cell. Car following in the ego's track (whose PET is just the headway) is left out
+    whatever the lane ids, so edge boundaries, junction lanes and curves do not count.
+    """
+    # Mean centreline point of every vehicle in every cell (headings need no normalizing to compare)
+    cells = intervals.assign(x=intervals["sum_x"] / intervals["points"], y=intervals["sum_y"] / intervals["points"])
+    ego = cells[cells["vid"] == ego_code].drop(columns="vid")
+    pairs = cells[cells["vid"] != ego_code].merge(ego, on=["cx", "cy"], suffixes=("", "_ego"))
+    if pairs.empty:
+        return np.inf, -1
+
+    dx, dy = (pairs["x"] - pairs["x_ego"]).to_numpy(), (pairs["y"] - pairs["y_ego"]).to_numpy()
+    hx, hy = pairs["sum_hx"].to_numpy(), pairs["sum_hy"].to_numpy()
+    ego_hx, ego_hy = pairs["sum_hx_ego"].to_numpy(), pairs["sum_hy_ego"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ego_norm = np.hypot(ego_hx, ego_hy)
+        lateral = np.abs(dx * ego_hy - dy * ego_hx) / ego_norm
+        cosine = (hx * ego_hx + hy * ego_hy) / (np.hypot(hx, hy) * ego_norm)
+    heading_difference = np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+    half_width = (pairs["width"].to_numpy() + pairs["width_ego"].to_numpy()) / 2
+    # Headings that cancel out within a cell (NaN) count as crossing
+    encroaching = ~(heading_difference <= angle) | ((lateral > offset) & (lateral < half_width))
+    pairs = pairs[encroaching]
+    if pairs.empty:
+        return np.inf, -1
+    after = pairs["min"].to_numpy() - pairs["max_ego"].to_numpy()
+    before = pairs["min_ego"].to_numpy() - pairs["max"].to_numpy()
+    pet = np.clip(np.maximum(after, before), 0, None)
+    i = np.argmin(pet)
+    return pet[i], pairs["vid"].to_numpy()[i]
+
+def analyse_fcd(fcd_path, ego_id=EGO_ID, window_steps=WINDOW_STEPS, vtypes=None, **options):
+    """Stream one FCD file in a single pass and return the ego's surrogate safety minima.
+
+    Vehicle sizes come from the FCD length/width attributes if present, else from `vtypes`
+    ({vType id: (length, width)}, see load_vtype_dimensions), else the SUMO defaults.
+    """
+    vehicle_codes = {}
+    vtypes = vtypes or {}
+    default_dimensions = (DEFAULT_LENGTH, DEFAULT_WIDTH)
+    pet_horizon = options.get("pet_horizon", PET_HORIZON)
+    state = _RunState()
+    steps = 0
+    time = 0.0
+    step_start = 0
+
+    columns = {"step": array("q"), "time": array("d"), "vid": array("i"),
+               "x": array("d"), "y": array("d"), "speed": array("d"), "angle": array("d"),
+               "length": array("d"), "width": array("d")}
+    ego_code = vehicle_codes.setdefault(ego_id, 0)
+    context = ET.iterparse(fcd_path, events=("start", "end"))
+    _, root = next(context)
+    try:
+        for event, elem in context:
+            if event == "start":
+                if elem.tag == "timestep":
+                    time = float(elem.get("time"))
+                    step_start = len(columns["step"])
+                continue
+            if elem.tag == "vehicle":
+                length, width = vtypes.get(elem.get("type"), default_dimensions)
+                columns["step"].append(steps)
+                columns["time"].append(time)
+                columns["vid"].append(vehicle_codes.setdefault(elem.get("id"), len(vehicle_codes)))
+                columns["x"].append(float(elem.get("x")))
+                columns["y"].append(float(elem.get("y")))
+                columns["speed"].append(float(elem.get("speed", 0)))
+                columns["angle"].append(float(elem.get("angle", 0)))
+                columns["length"].append(float(elem.get("length", length)))
+                columns["width"].append(float(elem.get("width", width)))
+            elif elem.tag == "timestep":
+                steps += 1
+                root.clear()
+                if steps % window_steps == 0:
+                    process_window(columns, ego_code, state, **options)
+                    # The last timestep starts the next window, so paths between windows are kept
+                    columns = {name: values[step_start:] for name, values in columns.items()}
+    except ET.ParseError as e:
+        # Keep the metrics of the timesteps read before the error (e.g. a run killed mid-write)
+        logging.error(f"Error parsing FCD file {fcd_path} after {steps} timesteps: {e}")
+    process_window(columns, ego_code, state, **options)
+
+    names = {code: name for name, code in vehicle_codes.items()}
+    # PETs beyond the horizon are not tracked reliably and are reported as no conflict
+    min_pet, pet_vehicle = state.min_pet if state.min_pet[0] <= pet_horizon else (np.inf, -1)
+    return {
+        "timesteps": steps,
+        "min_ttc": state.min_ttc[0], "min_ttc_time": state.min_ttc[1],
+        "min_ttc_vehicle": names.get(state.min_ttc[2], ""),
+        "min_pet": min_pet, "min_pet_vehicle": names.get(pet_vehicle, ""),
+        "max_drac": state.max_drac[0], "max_drac_time": state.max_drac[1],
+        "max_drac_vehicle": names.get(state.max_drac[2], "")
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute TTC, PET and DRAC of the ego vehicle from FCD output.")
+    parser.add_argument("paths", nargs="*", default=[fcd_folder], help="FCD files or folders of FCD files")
+    parser.add_argument("--output", default=output_file, help="Excel file for the per-run metrics")
+    parser.add_argument("--ego", default=EGO_ID, help="Ego vehicle id")
+    parser.add_argument("--radius", type=float, default=NEIGHBOUR_RADIUS, help="Neighbour radius in m")
+    parser.add_argument("--window", type=int, default=WINDOW_STEPS, help="Timesteps per processing window")
+    parser.add_argument("--routes", default=route_folder,
+                        help="Folder of the route files the runs used, for the vType lengths and widths")
+    args = parser.parse_args()
+
+    fcd_files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            fcd_files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".xml"))
+        elif os.path.exists(path):
+            fcd_files.append(path)
+        else:
+            print(f"Error: '{path}' does not exist.")
+
+    results = []
+    for fcd_path in fcd_files:
+        # fcd_<route file name> was written for the run of <route file name>
+        name = os.path.basename(fcd_path)
+        route_file = os.path.join(args.routes, name[len("fcd_"):]) if name.startswith("fcd_") else None
+        try:
+            vtypes = load_vtype_dimensions(route_file) if route_file and os.path.exists(route_file) else None
+            metrics = analyse_fcd(fcd_path, args.ego, args.window, vtypes, radius=args.radius)
+        except Exception as e:
+            logging.error(f"Unexpected error processing file {fcd_path}: {e}")
+            print(f"Error processing {fcd_path}: {e}")
+            continue
+        row = {"File": os.path.basename(fcd_path)}
+        row.update(extract_parameters_from_filename(os.path.basename(fcd_path)))
+        row.update(metrics)
+        results.append(row)
+        print(f"Processed {fcd_path}: min TTC {metrics['min_ttc']:.2f} s, "
+              f"min PET {metrics['min_pet']:.2f} s, max DRAC {metrics['max_drac']:.2f} m/s^2")
+
+    if results:
+        # Excel has no infinity; "no conflict" is written as an empty cell
+        df = pd.DataFrame(results).replace([np.inf, -np.inf], np.nan)
+        df.to_excel(args.output, index=False)
+        print(f"Surrogate safety metrics for {len(results)} runs saved to {args.output}")
+    else:
+        print("No data extracted. Please check your FCD files or folder path.")
+
+if __name__ == "__main__":
+    main()
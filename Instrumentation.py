@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import runpy
+import cProfile
+import argparse
+from contextlib import contextmanager
+
+def get_path_size(paths):
+    """Return the total size in bytes of the given files and directories (recursively)."""
+    total = 0
+    for path in paths or []:
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+        elif os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    try:
+                        total += os.path.getsize(os.path.join(dir_path, file_name))
+                    except OSError:
+                        pass
+    return total
+
+def _children_cpu_time():
+    """Return the CPU time used by terminated child processes of this process (0 where unsupported)."""
+    times = os.times()
+    return times.children_user + times.children_system
+
+class StageRecorder:
+    """Record wall time, CPU time and bytes written per pipeline stage as JSONL.
+
+    Every record is one JSON object per line with at least "event", "stage" and "timestamp".
+    Stages listed in `profile_stages` (or all stages with "*") are run under cProfile and
+    their statistics are dumped to `profile_dir` as <stage>_<n>.prof.
+    """
+
+    def __init__(self, log_file=None, profile_stages=(), profile_dir=None):
+        self.log_file = log_file
+        self.profile_stages = set(profile_stages)
+        self.profile_dir = profile_dir or (os.path.dirname(os.path.abspath(log_file)) if log_file else os.getcwd())
+        self._profile_counts = {}
+        self.last_record = None
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+
+    def emit(self, event, stage, **fields):
+        """Write a single record to the JSONL log."""
+        record = {"event": event, "stage": stage, "timestamp": time.time()}
+        record.update(fields)
+        if self.log_file:
+            with open(self.log_file, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        return record
+
+    def should_profile(self, stage):
+        return "*" in self.profile_stages or stage in self.profile_stages
+
+    @contextmanager
+    def stage(self, stage, output_paths=None, **fields):
+        """Time a block of code; bytes written are measured as the size growth of `output_paths`."""
+        bytes_before = get_path_size(output_paths)
+        profiler = cProfile.Profile() if self.should_profile(stage) else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = _children_cpu_time()
+        status = "success"
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield fields
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(stage, profiler)
+            self.last_record = self.emit("stage", stage, status=status,
+                                         wall_time=time.perf_counter() - wall_start,
+                                         cpu_time=time.process_time() - cpu_start,
+                                         children_cpu_time=_children_cpu_time() - children_cpu_start,
+                                         bytes_written=get_path_size(output_paths) - bytes_before,
+                                         **fields)
+
+    def _dump_profile(self, stage, profiler):
+        count = self._profile_counts.get(stage, 0) + 1
+        self._profile_counts[stage] = count
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_file = os.path.join(self.profile_dir, f"{stage}_{count}.prof")
+        profiler.dump_stats(profile_file)
+        print(f"Profile for stage '{stage}' saved to {profile_file}")
+
+    def run_script(self, script_path, output_paths=None):
+        """Run a compile script as __main__ inside an instrumented stage named after the script."""
+        stage = os.path.splitext(os.path.basename(script_path))[0]
+        with self.stage(stage, output_paths=output_paths, script=script_path):
+            runpy.run_path(script_path, run_name="__main__")
+
+class ProgressTracker:
+    """Print and record live progress (runs/min, ETA, queue depth) for a batch of runs."""
+
+    def __init__(self, total, recorder=None, stage="sumo_runs"):
+        self.total = total
+        self.done = 0
+        self.recorder = recorder
+        self.stage = stage
+        self.start_time = time.perf_counter()
+
+    def update(self, queue_depth=None, count=1):
+        self.done += count
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.done / elapsed * 60 if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate * 60 if rate > 0 else None
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "--:--:--"
+        print(f"[{self.done}/{self.total}] {rate:.1f} runs/min, ETA {eta_text}, queue depth {queue_depth}")
+        if self.recorder is not None:
+            self.recorder.emit("progress", self.stage, done=self.done, total=self.total,
+                               runs_per_min=rate, eta_seconds=eta, queue_depth=queue_depth)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run compile scripts with stage instrumentation.")
+    parser.add_argument("scripts", nargs="+", help="Compile scripts to run, e.g. Compilation_TripInfo.py")
+    parser.add_argument("--log", default="pipeline_metrics.jsonl", help="JSONL file for stage records")
+    parser.add_argument("--profile", nargs="*", default=[],
+                        help="Stage names to run under cProfile ('*' for all)")
+    parser.add_argument("--profile-dir", default=None, help="Directory for .prof files")
+    args = parser.parse_args()
+
+    recorder = StageRecorder(args.log, profile_stages=args.profile, profile_dir=args.profile_dir)
+    for script in args.scripts:
+        try:
+            recorder.run_script(script)
+        except Exception as e:
+            print(f"Error running {script}: {e}", file=sys.stderr)
+    print(f"Stage records written to {args.log}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import os
+import re
+import sys
+import time
+import argparse
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+# Sweep output directory (SIM_OUTPUT_DIR overrides the default) and the per-run output folders
+output_base_dir = os.environ.get("SIM_OUTPUT_DIR", r"C:\Users\aftaa\OneDrive\Desktop\Polito Mechanical\Thesis\Simulations\Automatisation\4\Output_new")
+statistics_folder = os.path.join(output_base_dir, "Statistics")
+tripinfo_folder = os.path.join(output_base_dir, "Tripinfo")
+cube_file = os.path.join(output_base_dir, "Summary_Cube.pkl")
+
+# Vehicle whose trip is summarized
+EGO_ID = "v_0"
+
+# Cube dimensions: the swept vType ID and the swept parameters
+DIMENSIONS = ["route", "lcSigma", "tau", "actionStepLength", "minGapLat"]
+
+# Per-run measures; counts and sums are stored so cell means can be marginalized exactly
+MEASURES = ["collided", "collisions", "emergencyBraking", "teleports", "duration", "timeLoss"]
+
+# Measures that can be queried as quantiles (e.g. "timeLoss_p90"); quantiles do not
+# marginalize, so they are recomputed from the matching runs
+QUANTILE_MEASURES = ["duration", "timeLoss"]
+
+def _run_key(file_name):
+    """Strip the output-type prefix and extension so the statistics and tripinfo files of a run match."""
+    return re.sub(r"\.xml$", "", re.sub(r"^(statistics|tripinfo|collisions|lanechange)_", "", file_name))
+
+def _parameters_from_key(keys):
+    params = pd.DataFrame(index=keys.index)
+    params["route"] = pd.to_numeric(keys.str.extract(r"route_(-?\d+)", expand=False), errors="coerce")
+    for param in DIMENSIONS[1:]:
+        params[param] = pd.to_numeric(keys.str.extract(re.escape(param) + r"(-?\d+\.\d+|-?\d+)", expand=False),
+                                      errors="coerce")
+    return params
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def read_statistics(path):
+    """Return the collisions, emergency brakings and teleports of a statistic-output file."""
+    root = ET.parse(path).getroot()
+    safety = root.find("safety")
+    teleports = root.find("teleports")
+    return {
+        "collisions": _to_float(safety.get("collisions")) if safety is not None else np.nan,
+        "emergencyBraking": _to_float(safety.get("emergencyBraking")) if safety is not None else np.nan,
+        "teleports": _to_float(teleports.get("total")) if teleports is not None else np.nan
+    }
+
+def read_ego_trip(path, ego_id=EGO_ID):
+    """Return the ego's duration and timeLoss from a tripinfo-output file, stopping at its row."""
+    for _, elem in ET.iterparse(path, events=("start",)):
+        if elem.tag == "tripinfo" and elem.get("id") == ego_id:
+            return {"duration": _to_float(elem.get("duration")), "timeLoss": _to_float(elem.get("timeLoss"))}
+    return {"duration": np.nan, "timeLoss": np.nan}
+
+def scan_files(folder):
+    """Return {file name: (mtime, size)} for the XML files of an output folder."""
+    if not folder or not os.path.isdir(folder):
+        return {}
+    files = {}
+    for name in os.listdir(folder):
+        if name.endswith(".xml"):
+            stat = os.stat(os.path.join(folder, name))
+            files[name] = (stat.st_mtime, stat.st_size)
+    return files
+
+def load_runs(statistics_folder, tripinfo_folder=None, keys=None):
+    """Build the per-run table (one row per statistics file) straight from the run XML files.
+
+    Only the runs in `keys` are read when given. Runs whose statistics file cannot be read
+    are skipped; a missing or unreadable tripinfo file leaves duration and timeLoss NaN.
+    """
+    if keys is None:
+        keys = [_run_key(name) for name in scan_files(statistics_folder)]
+    rows = []
+    for key in sorted(keys):
+        try:
+            row = {"run": key, **read_statistics(os.path.join(statistics_folder, f"statistics_{key}.xml"))}
+        except (ET.ParseError, OSError) as e:
+            print(f"Skipping run {key}: {e}")
+            continue
+        trip = {"duration": np.nan, "timeLoss": np.nan}
+        trip_path = os.path.join(tripinfo_folder, f"tripinfo_{key}.xml") if tripinfo_folder else None
+        if trip_path and os.path.exists(trip_path):
+            try:
+                trip = read_ego_trip(trip_path)
+            except ET.ParseError as e:
+                print(f"Could not read the trip of run {key}: {e}")
+        rows.append({**row, **trip})
+    runs = pd.DataFrame(rows, columns=["run", "collisions", "emergencyBraking", "teleports", "duration", "timeLoss"])
+    runs = runs.join(_parameters_from_key(runs["run"].astype(str)))
+    runs["collided"] = (runs["collisions"] > 0).astype(float)
+    return runs[["run"] + DIMENSIONS + MEASURES]
+
+def aggregate_cells(runs, by=DIMENSIONS):
+    """Aggregate runs into cube cells: run counts and per-measure counts and sums."""
+    grouped = runs[list(by) + MEASURES].groupby(list(by), dropna=False)
+    cells = grouped.size().rename("n_runs").to_frame()
+    cells = cells.join(grouped[MEASURES].count().add_suffix("_n"))
+    cells = cells.join(grouped[MEASURES].sum().add_suffix("_sum"))
+    return cells.reset_index()
+
+def build_cube(runs, files=None):
+    return {"runs": runs.reset_index(drop=True), "cube": aggregate_cells(runs),
+            "files": files or {}, "updated": time.time()}
+
+def update_cube(cube, new_runs, removed=()):
+    """Add (or replace) runs, drop the `removed` run keys and recompute only the cells they touch."""
+    is_removed = cube["runs"]["run"].isin(list(removed))
+    runs = pd.concat([cube["runs"][~is_removed], new_runs]).drop_duplicates("run", keep="last").reset_index(drop=True)
+    affected = pd.concat([new_runs[DIMENSIONS], cube["runs"].loc[is_removed, DIMENSIONS]]).drop_duplicates()
+    affected_runs = runs.merge(affected, on=DIMENSIONS)
+    recomputed = aggregate_cells(affected_runs)
+    kept = cube["cube"].merge(affected, on=DIMENSIONS, how="left", indicator=True)
+    kept = kept[kept["_merge"] == "left_only"].drop(columns="_merge")
+    cells = pd.concat([kept, recomputed], ignore_index=True).sort_values(DIMENSIONS, ignore_index=True)
+    return {"runs": runs, "cube": cells, "files": cube.get("files", {}), "updated": time.time()}
+
+def load_cube(path):
+    return pd.read_pickle(path)
+
+def save_cube(cube, path):
+    pd.to_pickle(cube, path)
+
+def refresh_cube(path, statistics_folder, tripinfo_folder=None):
+    """Create the cube, or bring it in line with the run output folders.
+
+    The cube remembers the mtime and size of every statistics and tripinfo file it has read,
+    so a refresh only lists the folders and parses the files that are new or changed; runs
+    whose statistics file was deleted are dropped. The compiled workbooks are not needed.
+    """
+    files = {"statistics": scan_files(statistics_folder), "tripinfo": scan_files(tripinfo_folder)}
+    cube = load_cube(path) if os.path.exists(path) else None
+    if cube is None or "files" not in cube:
+        runs = load_runs(statistics_folder, tripinfo_folder)
+        cube = build_cube(runs, files)
+        print(f"Built cube with {len(cube['cube'])} cells from {len(runs)} runs")
+    else:
+        changed = set()
+        for kind, current in files.items():
+            previous = cube["files"].get(kind, {})
+            changed |= {_run_key(name) for name, signature in current.items() if previous.get(name) != signature}
+            changed |= {_run_key(name) for name in previous if name not in current}
+        present = {_run_key(name) for name in files["statistics"]}
+        removed = set(cube["runs"]["run"]) - present
+        changed &= present
+        if not changed and not removed:
+            print("Cube is up to date")
+            return cube
+        new_runs = load_runs(statistics_folder, tripinfo_folder, changed)
+        cube = update_cube(cube, new_runs, removed)
+        cube["files"] = files
+        print(f"Updated cube with {len(new_runs)} new or changed runs and {len(removed)} removed runs "
+              f"({len(cube['cube'])} cells)")
+    save_cube(cube, path)
+    return cube
+
+def _apply_where(frame, where):
+    """Filter rows by {dimension: value | list of values | (operator, value)}."""
+    operators = {"==": np.equal, "!=": np.not_equal, ">=": np.greater_equal,
+                 "<=": np.less_equal, ">": np.greater, "<": np.less}
+    mask = np.ones(len(frame), dtype=bool)
+    for dimension, condition in (where or {}).items():
+        column = frame[dimension].to_numpy()
+        if isinstance(condition, tuple):
+            operator, value = condition
+            mask &= operators[operator](column, value)
+        elif isinstance(condition, (list, set)):
+            mask &= np.isin(column, list(condition))
+        else:
+            mask &= np.isclose(column, condition)
+    return frame[mask]
+
+def query(cube, metric, by=(), where=None):
+    """Slice the cube with `where` and marginalize it onto the `by` dimensions.
+
+    `metric` is a measure name (mean per run), "collision_rate" (share of runs with a
+    collision) or a quantile such as "duration_p90", which is recomputed from the matching
+    runs. The sweep runs every parameter combination once, so there are no replications to
+    build confidence intervals from and none are reported; n_runs only counts the parameter
+    combinations averaged into each row. Raises ValueError for an unknown metric.
+    """
+    by = list(by)
+    match = re.fullmatch(r"(\w+)_p(\d+)", metric)
+    if match:
+        measure, percentile = match.group(1), int(match.group(2)) / 100
+        if measure not in QUANTILE_MEASURES or not 0 <= percentile <= 1:
+            raise ValueError(f"Unknown quantile metric '{metric}', expected e.g. "
+                             f"'{QUANTILE_MEASURES[0]}_p90' with one of {', '.join(QUANTILE_MEASURES)}")
+        runs = _apply_where(cube["runs"], where)
+        if by:
+            result = runs.groupby(by)[measure].agg(n_runs="count", value=lambda s: s.quantile(percentile))
+        else:
+            result = pd.DataFrame({"n_runs": [runs[measure].count()], "value": [runs[measure].quantile(percentile)]})
+        return result.reset_index() if by else result
+
+    measure = "collided" if metric == "collision_rate" else metric
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown metric '{metric}', expected collision_rate or one of {', '.join(MEASURES)}")
+    cells = _apply_where(cube["cube"], where)
+    columns = [f"{measure}_n", f"{measure}_sum"]
+    totals = cells.groupby(by)[columns].sum() if by else cells[columns].sum().to_frame().T
+    n = totals[f"{measure}_n"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = totals[f"{measure}_sum"].to_numpy() / n
+    result = pd.DataFrame({"n_runs": n.astype(int), "value": mean}, index=totals.index)
+    return result.reset_index() if by else result.reset_index(drop=True)
+
+def _parse_where(expressions, route=None):
+    where = {}
+    for expression in expressions or []:
+        match = re.fullmatch(r"\s*(\w+)\s*(==|!=|>=|<=|>|<|=)\s*(-?[\d.]+)\s*", expression)
+        if not match or match.group(1) not in DIMENSIONS:
+            raise ValueError(f"Invalid condition '{expression}', expected e.g. 'lcSigma>=0.5'")
+        dimension, operator, value = match.groups()
+        where[dimension] = ("==" if operator == "=" else operator, float(value))
+    if route is not None:
+        where["route"] = ("==", float(route))
+    return where
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the sweep summary cube.")
+    parser.add_argument("--cube", default=cube_file, help="Cube file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Create or incrementally update the cube")
+    build_parser.add_argument("--statistics", default=statistics_folder, help="Folder of statistic-output files")
+    build_parser.add_argument("--tripinfo", default=tripinfo_folder, help="Folder of tripinfo-output files")
+
+    query_parser = subparsers.add_parser("query", help="Slice and marginalize the cube")
+    query_parser.add_argument("metric", help="collision_rate, collisions, emergencyBraking, teleports, "
+                                             "duration, timeLoss, or a quantile such as timeLoss_p90")
+    query_parser.add_argument("--route", type=float, default=None, help="Swept vType ID")
+    query_parser.add_argument("--where", action="append", help="Condition such as 'lcSigma>=0.5' (repeatable)")
+    query_parser.add_argument("--by", nargs="*", default=[], choices=DIMENSIONS, help="Dimensions to keep")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        refresh_cube(args.cube, args.statistics, args.tripinfo)
+        return 0
+
+    try:
+        where = _parse_where(args.where, args.route)
+        cube = load_cube(args.cube)
+        start = time.perf_counter()
+        result = query(cube, args.metric, args.by, where)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(result.to_string(index=False))
+    print(f"({elapsed_ms:.1f} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
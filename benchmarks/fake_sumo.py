@@ -0,0 +1,179 @@
+"""Stand-in for the sumo binary used by the benchmark suite.
+
+Reads a .sumocfg, sleeps for a controllable time and writes synthetic collision,
+statistic, tripinfo, lanechange (and fcd, if configured) outputs. All output is
+derived from the route file name, so expected results can be computed without
+running it (see expected_run_outputs). The device.tripinfo/device.fcd explicit,
+probability and radius options are honoured like SUMO does for the vehicle ids.
+
+Environment variables:
+    FAKE_SUMO_RUNTIME    seconds each run takes (default 0.1)
+    FAKE_SUMO_VEHICLES   number of vehicles per run, controls output size (default 200)
+    FAKE_SUMO_MEMORY_MB  memory to allocate while running, to exercise the watchdog (default 0)
+"""
+import os
+import sys
+import time
+import math
+import zlib
+import random
+import xml.etree.ElementTree as ET
+
+OUTPUT_OPTIONS = ["collision-output", "statistic-output", "tripinfo-output",
+                  "lanechange-output", "fcd-output"]
+
+def run_seed(route_file):
+    """Deterministic seed for a run, taken from the route file name."""
+    return zlib.crc32(os.path.basename(route_file).encode())
+
+def expected_run_outputs(route_file, vehicles):
+    """Return the collisions and statistics the fake sumo writes for a route file."""
+    seed = run_seed(route_file)
+    n_collisions = seed % 4
+    collisions = []
+    for i in range(n_collisions):
+        # The first collision of every third run has the ego vehicle as victim
+        victim = "v_0" if i == 0 and seed % 3 == 0 else f"v_{(seed + i) % vehicles or 1}"
+        collider = f"v_{(seed + 7 * i + 1) % vehicles or 2}"
+        collisions.append((collider, victim))
+    return {
+        "collisions": collisions,
+        "v_0_victim": any(victim == "v_0" for _, victim in collisions),
+        "emergencyBraking": seed % 5,
+        "teleports": seed % 2,
+        "tripinfo_rows": vehicles,
+        "lanechange_rows": 2 * vehicles
+    }
+
+def write_collisions(path, expected, rng):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<collisions>\n')
+        for collider, victim in expected["collisions"]:
+            f.write(f'    <collision time="{rng.uniform(10, 300):.2f}" type="collision" lane="E0_1" '
+                    f'pos="{rng.uniform(0, 500):.2f}" collider="{collider}" victim="{victim}" '
+                    f'colliderType="1" victimType="2" colliderSpeed="{rng.uniform(5, 30):.2f}" '
+                    f'victimSpeed="{rng.uniform(5, 30):.2f}"/>\n')
+        f.write('</collisions>\n')
+
+def write_statistics(path, expected, vehicles):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<statistics>\n'
+                f'    <vehicles loaded="{vehicles}" inserted="{vehicles}" running="0" waiting="0"/>\n'
+                f'    <teleports total="{expected["teleports"]}" jam="0" yield="0" wrongLane="0"/>\n'
+                f'    <safety collisions="{len(expected["collisions"])}" emergencyStopping="0" '
+                f'emergencyBraking="{expected["emergencyBraking"]}"/>\n'
+                '</statistics>\n')
+
+def equipped_vehicles(options, device):
+    """Return the set of vehicle ids equipped with a device, or None if all vehicles are."""
+    explicit = options.get(f"device.{device}.explicit")
+    probability = options.get(f"device.{device}.probability")
+    if explicit is None and probability in (None, "1"):
+        return None
+    return set((explicit or "").replace(",", " ").split())
+
+def write_tripinfo(path, vehicles, rng, equipped=None):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tripinfos>\n')
+        for i in range(vehicles):
+            vid = f"v_{i}"
+            depart = i * 1.0
+            duration = rng.uniform(100, 300)
+            # Values are drawn for every vehicle so the random stream is the same for any filter
+            line = (f'    <tripinfo id="{vid}" depart="{depart:.2f}" departLane="E0_{i % 3}" '
+                    f'departPos="5.10" departSpeed="20.00" departDelay="0.00" '
+                    f'arrival="{depart + duration:.2f}" arrivalLane="E9_{i % 3}" arrivalPos="500.00" '
+                    f'arrivalSpeed="{rng.uniform(10, 30):.2f}" duration="{duration:.2f}" '
+                    f'routeLength="4200.00" waitingTime="0.00" waitingCount="0" stopTime="0.00" '
+                    f'timeLoss="{rng.uniform(0, 40):.2f}" rerouteNo="0" devices="tripinfo_{vid}" '
+                    f'vType="{i % 3 + 1}" speedFactor="{rng.uniform(0.9, 1.1):.2f}" vaporized=""/>\n')
+            if equipped is None or vid in equipped:
+                f.write(line)
+        f.write('</tripinfos>\n')
+
+def write_lanechange(path, vehicles, rng):
+    reasons = ["speedGain", "keepRight", "strategic", "cooperative", "sublane"]
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<lanechanges>\n')
+        for event in range(2 * vehicles):
+            i = event // 2
+            time_s = i * 1.0 + (event % 2) * rng.uniform(5, 60)
+            from_lane = rng.randint(0, 2)
+            to_lane = from_lane + (1 if from_lane < 2 else -1)
+            leader_gap = f"{rng.uniform(0.5, 80):.2f}" if rng.random() > 0.1 else "None"
+            follower_gap = f"{rng.uniform(0.5, 80):.2f}" if rng.random() > 0.1 else "None"
+            f.write(f'    <change id="v_{i}" type="{i % 3 + 1}" time="{time_s:.2f}" '
+                    f'from="E{i % 10}_{from_lane}" to="E{i % 10}_{to_lane}" '
+                    f'dir="{to_lane - from_lane}" speed="{rng.uniform(5, 30):.2f}" '
+                    f'pos="{rng.uniform(0, 500):.2f}" reason="{rng.choice(reasons)}" '
+                    f'leaderGap="{leader_gap}" leaderSecureGap="{rng.uniform(0, 40):.2f}" '
+                    f'followerGap="{follower_gap}" followerSecureGap="{rng.uniform(0, 40):.2f}" '
+                    f'origLeaderGap="None" origLeaderSecureGap="None" latGap="{rng.uniform(0, 2):.2f}"/>\n')
+        f.write('</lanechanges>\n')
+
+def write_fcd(path, vehicles, rng, steps=100, equipped=None, radius=0.0):
+    """Write FCD of the equipped vehicles and of all vehicles within radius of one of them."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<fcd-export>\n')
+        for step in range(steps):
+            f.write(f'    <timestep time="{step * 0.1:.2f}">\n')
+            positions = [(i * 20.0 + step * 2.5, (i % 3) * 3.2) for i in range(vehicles)]
+            if equipped is not None:
+                centres = [positions[i] for i in range(vehicles) if f"v_{i}" in equipped]
+            for i in range(vehicles):
+                lane = i % 3
+                x, y = positions[i]
+                if equipped is not None and f"v_{i}" not in equipped and \
+                        not any(math.hypot(x - cx, y - cy) <= radius for cx, cy in centres):
+                    continue
+                f.write(f'        <vehicle id="v_{i}" x="{x:.2f}" y="{lane * 3.2:.2f}" angle="90.00" '
+                        f'type="{lane + 1}" speed="25.00" pos="{x:.2f}" lane="E0_{lane}" slope="0.00"/>\n')
+            f.write('    </timestep>\n')
+        f.write('</fcd-export>\n')
+
+def read_config(config_file):
+    """Return all option values of a .sumocfg keyed by option name."""
+    root = ET.parse(config_file).getroot()
+    options = {}
+    for elem in root.iter():
+        if elem.get("value") is not None:
+            options[elem.tag] = elem.get("value")
+    return options
+
+def main(argv):
+    if "-c" not in argv or argv.index("-c") + 1 >= len(argv):
+        print("Error: fake sumo needs '-c <config>'", file=sys.stderr)
+        return 1
+    config_file = argv[argv.index("-c") + 1]
+    try:
+        options = read_config(config_file)
+    except (ET.ParseError, OSError) as e:
+        print(f"Error: could not read configuration {config_file}: {e}", file=sys.stderr)
+        return 1
+
+    runtime = float(os.environ.get("FAKE_SUMO_RUNTIME", "0.1"))
+    vehicles = int(os.environ.get("FAKE_SUMO_VEHICLES", "200"))
+    ballast = bytearray(int(float(os.environ.get("FAKE_SUMO_MEMORY_MB", "0")) * 1024 * 1024))
+    time.sleep(runtime)
+
+    route_file = options.get("route-files", "")
+    expected = expected_run_outputs(route_file, vehicles)
+    rng = random.Random(run_seed(route_file))
+
+    writers = {
+        "collision-output": lambda path: write_collisions(path, expected, rng),
+        "statistic-output": lambda path: write_statistics(path, expected, vehicles),
+        "tripinfo-output": lambda path: write_tripinfo(path, vehicles, rng,
+                                                       equipped_vehicles(options, "tripinfo")),
+        "lanechange-output": lambda path: write_lanechange(path, vehicles, rng),
+        "fcd-output": lambda path: write_fcd(path, vehicles, rng, equipped=equipped_vehicles(options, "fcd"),
+                                             radius=float(options.get("device.fcd.radius", 0)))
+    }
+    for option in OUTPUT_OPTIONS:
+        if options.get(option):
+            writers[option](options[option])
+    del ballast
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
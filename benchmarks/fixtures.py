@@ -0,0 +1,123 @@
+"""Synthetic fixtures for the benchmark suite: route template, sweep ranges, sumocfg and FCD."""
+import math
+import random
+
+# Swept vType attributes and the first value of each range
+SWEEP_PARAMETERS = {
+    "lcSigma": 0.1,
+    "tau": 0.5,
+    "actionStepLength": 0.2,
+    "minGapLat": 0.3
+}
+
+# x offset of planted vehicle pairs in the FCD fixture; small enough to fall below the
+# 2.5 m threshold of FCD GEO_LateralGap.py, which treats x/y as degrees
+PLANTED_PAIR_OFFSET = 0.00001
+
+# x spacing of consecutive vehicles in the FCD fixture (three lanes, so 21.9 per lane)
+VEHICLE_SPACING = 7.3
+
+def write_route_template(path, n_vtypes, n_vehicles=10):
+    """Write a route file with vTypes "1".."n_vtypes" and a few vehicles using them."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n')
+        for i in range(1, n_vtypes + 1):
+            f.write(f'    <vType id="{i}" length="5.00" minGap="2.50" maxSpeed="33.33" accel="2.6" '
+                    f'decel="4.5" sigma="0.5" lcSigma="0.0" tau="1.0" actionStepLength="0.5" '
+                    f'minGapLat="0.6" latAlignment="center"/>\n')
+        f.write('    <route id="r_0" edges="E0 E1 E2"/>\n')
+        for i in range(n_vehicles):
+            f.write(f'    <vehicle id="v_{i}" type="{i % n_vtypes + 1}" route="r_0" depart="{i:.2f}"/>\n')
+        f.write('</routes>\n')
+
+def sweep_csv_data(n_ids, values_per_parameter, step=0.1):
+    """Return sweep ranges in the format of Automation.extract_data_from_csv.
+
+    Every swept ID gets values_per_parameter values for each of SWEEP_PARAMETERS,
+    so the sweep has n_ids * values_per_parameter ** len(SWEEP_PARAMETERS) runs.
+    """
+    data = {}
+    for sim_id in range(1, n_ids + 1):
+        data[sim_id] = {}
+        for param, start in SWEEP_PARAMETERS.items():
+            data[sim_id][param] = {
+                "start": start,
+                "end": round(start + step * (values_per_parameter - 1), 2),
+                "step": step,
+                "num_simulations": 1
+            }
+    return data
+
+def expected_run_count(n_ids, values_per_parameter):
+    return n_ids * values_per_parameter ** len(SWEEP_PARAMETERS)
+
+def write_sumocfg(path, end_time=3600):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<configuration>\n'
+                '    <input>\n        <net-file value="net.net.xml"/>\n'
+                '        <route-files value="routes.rou.xml"/>\n    </input>\n'
+                f'    <time>\n        <begin value="0"/>\n        <end value="{end_time}"/>\n    </time>\n'
+                '    <output/>\n</configuration>\n')
+
+def write_fcd(path, size_mb, vehicles_per_step=50, pair_every=10, seed=0):
+    """Stream an FCD file of roughly size_mb MB and return the number of planted close pairs.
+
+    Vehicles on a lane are 21.9 apart, which never wraps to a multiple of 360, so the
+    only pairs closer than 2.5 m (in either metres or the degree interpretation of
+    FCD GEO_LateralGap.py) are the planted ones: every pair_every-th timestep, v_0
+    gets a shadow vehicle on its own lane.
+    """
+    rng = random.Random(seed)
+    target_bytes = size_mb * 1024 * 1024
+    written = 0
+    planted = 0
+    step = 0
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<fcd-export>\n')
+        while written < target_bytes:
+            time_s = step * 0.1
+            lines = [f'    <timestep time="{time_s:.2f}">\n']
+            for i in range(vehicles_per_step):
+                lane = i % 3
+                x = i * VEHICLE_SPACING + step * 2.5
+                lines.append(f'        <vehicle id="v_{i}" x="{x:.5f}" y="{lane * 3.2:.2f}" angle="90.00" '
+                             f'type="{lane + 1}" speed="{25.0 + rng.uniform(-1, 1):.2f}" pos="{x:.2f}" '
+                             f'lane="E0_{lane}" slope="0.00"/>\n')
+            if step % pair_every == 0:
+                x = step * 2.5 + PLANTED_PAIR_OFFSET
+                lines.append(f'        <vehicle id="shadow_{step}" x="{x:.5f}" y="0.00" angle="90.00" '
+                             f'type="1" speed="25.00" pos="{x:.2f}" lane="E0_0" slope="0.00"/>\n')
+                planted += 1
+            lines.append('    </timestep>\n')
+            chunk = "".join(lines)
+            f.write(chunk)
+            written += len(chunk)
+            step += 1
+        f.write('</fcd-export>\n')
+    return planted
+
+def write_pair_fcd(path, manoeuvre, steps=100):
+    """Write a short FCD file of v_0 and v_1 driving east at 20 m/s on a straight road.
+
+    "follow": v_1 stays 30 m ahead in v_0's lane, whose id changes from E0_0 to E1_0 at
+    x = 100 as at an edge boundary; car following has no PET. "cut_in": v_1 starts 15 m
+    ahead on the lane to the left and moves into v_0's lane over 2 s, which gives a PET.
+    """
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<fcd-export>\n')
+        for step in range(steps):
+            time_s = step * 0.1
+            x = 20 * time_s
+            f.write(f'    <timestep time="{time_s:.2f}">\n'
+                    f'        <vehicle id="v_0" x="{x:.2f}" y="0.00" angle="90.00" speed="20.00" lane="E0_0"/>\n')
+            if manoeuvre == "follow":
+                lane = "E1_0" if x + 30 > 100 else "E0_0"
+                f.write(f'        <vehicle id="v_1" x="{x + 30:.2f}" y="0.00" angle="90.00" speed="20.00" '
+                        f'lane="{lane}"/>\n')
+            else:
+                progress = min(max(time_s - 1, 0) / 2, 1)
+                angle = 90 + (math.degrees(math.atan2(1.6, 20)) if 0 < progress < 1 else 0)
+                f.write(f'        <vehicle id="v_1" x="{x + 15:.2f}" y="{3.2 * (1 - progress):.2f}" '
+                        f'angle="{angle:.2f}" speed="20.00" lane="{"E0_1" if progress < 0.5 else "E0_0"}"/>\n')
+            f.write('    </timestep>\n')
+        f.write('</fcd-export>\n')
@@ -0,0 +1,282 @@
+"""End-to-end benchmark of the sweep pipeline on synthetic fixtures.
+
+Runs route generation, config writing, SUMO launching (with the fake sumo in this
+directory), collision filtering, every compile script and the lateral-gap analysis
+in a scratch directory. Outputs are checked against the results expected from the
+fixtures and against the golden digests in golden.json; throughput per stage is
+reported and written to benchmark_results.json.
+
+Example:
+    python benchmarks/run_benchmarks.py --ids 2 --values 2 --vehicles 500 --fcd-mb 50
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import runpy
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import pandas as pd
+
+import Automation
+from Instrumentation import StageRecorder
+from fake_sumo import expected_run_outputs
+import fixtures
+
+COMPILE_SCRIPTS = [
+    "Compilation_Route Files.py",
+    "All_Compilation_Collisions.py",
+    "Compilation_Statistics.py",
+    "Compilation_TripInfo.py",
+    "Compilation_LaneChange.py",
+    "Compilation_LaneChangeEvents.py"
+]
+
+# Compiled workbook of each compile script, relative to the sweep output directory
+COMPILED_OUTPUTS = {
+    "Compilation_Route Files.py": os.path.join("Route_files", "Compiled_Route_Data.xlsx"),
+    "All_Compilation_Collisions.py": os.path.join("Filtered_Collisions", "All_Collisions.xlsx"),
+    "Compilation_Statistics.py": os.path.join("Statistics", "extracted_data.xlsx"),
+    "Compilation_TripInfo.py": os.path.join("Tripinfo", "Compiled.xlsx"),
+    "Compilation_LaneChange.py": os.path.join("lanechange", "Compiled.xlsx"),
+    "Compilation_LaneChangeEvents.py": os.path.join("lanechange", "LaneChange_Aggregates.xlsx")
+}
+
+LATERAL_GAP_SCRIPT = "FCD GEO_LateralGap.py"
+
+@contextlib.contextmanager
+def _quiet(enabled):
+    """Silence the per-file progress prints of the pipeline while timing it."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+@contextlib.contextmanager
+def _environment(**variables):
+    old = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _frame_digest(df):
+    """Order-independent digest of a compiled table."""
+    rows = sorted("|".join(map(str, row)) for row in df.itertuples(index=False))
+    return hashlib.sha256("\n".join(list(df.columns) + rows).encode()).hexdigest()
+
+def _count_files(directory, suffix=".xml"):
+    return len([f for f in os.listdir(directory) if f.endswith(suffix)])
+
+def run_benchmark(args, workdir):
+    recorder = StageRecorder(os.path.join(workdir, "bench_metrics.jsonl"),
+                             profile_stages=args.profile)
+    output_dir = os.path.join(workdir, "Output_new")
+    route_files_dir = os.path.join(output_dir, "Route_files")
+    temp_config_dir = os.path.join(workdir, "temp_configs")
+    filtered_collisions_dir = os.path.join(output_dir, "Filtered_Collisions")
+    output_dirs = {
+        "collision-output": os.path.join(output_dir, "Collisions"),
+        "statistic-output": os.path.join(output_dir, "Statistics"),
+        "tripinfo-output": os.path.join(output_dir, "Tripinfo"),
+        "lanechange-output": os.path.join(output_dir, "lanechange"),
+        "fcd-output": os.path.join(output_dir, "Fcd")
+    }
+    for directory in [route_files_dir, temp_config_dir, filtered_collisions_dir] + list(output_dirs.values()):
+        os.makedirs(directory, exist_ok=True)
+
+    stages = []
+    def timed(stage, items, output_paths, function, *function_args):
+        with _quiet(not args.verbose), recorder.stage(stage, output_paths=output_paths, items=items):
+            value = function(*function_args)
+        stages.append(recorder.last_record)
+        return value
+
+    # Fixtures
+    template_file = os.path.join(workdir, "template.rou.xml")
+    config_file = os.path.join(workdir, "base.sumocfg")
+    fcd_file = os.path.join(workdir, "fcd.xml")
+    fixtures.write_route_template(template_file, args.vtypes)
+    fixtures.write_sumocfg(config_file)
+    csv_data = fixtures.sweep_csv_data(args.ids, args.values)
+    runs = fixtures.expected_run_count(args.ids, args.values)
+    planted_pairs = timed("write_fcd_fixture", 1, [fcd_file], fixtures.write_fcd, fcd_file, args.fcd_mb)
+
+    # Pipeline stages
+    timed("generate_route_files", runs, [route_files_dir],
+          Automation.generate_route_files, template_file, route_files_dir, csv_data)
+    config_files = timed("write_config_files", runs, [temp_config_dir],
+                         Automation.write_config_files, config_file, os.path.join(workdir, "net.net.xml"),
+                         route_files_dir, output_dirs, temp_config_dir, args.output_profile)
+    with _environment(PATH=BENCHMARK_DIR + os.pathsep + os.environ.get("PATH", ""),
+                      FAKE_SUMO_RUNTIME=str(args.sumo_runtime),
+                      FAKE_SUMO_VEHICLES=str(args.vehicles)):
+        results = timed("run_simulations", runs, list(output_dirs.values()),
+                        Automation.run_simulations, config_files, args.workers, args.timeout,
+                        None, None, 0, recorder)
+    timed("filter_collision_files", runs, [filtered_collisions_dir],
+          Automation.filter_collision_files, output_dirs["collision-output"], filtered_collisions_dir)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with _environment(SIM_OUTPUT_DIR=output_dir):
+            for script in COMPILE_SCRIPTS:
+                compiled_file = os.path.join(output_dir, COMPILED_OUTPUTS[script])
+                timed(os.path.splitext(script)[0], runs, [compiled_file],
+                      runpy.run_path, os.path.join(REPO_DIR, script), None, "__main__")
+        lateral_gap_output = os.path.join(workdir, "lateral_gaps.xlsx")
+        with _environment(SIM_FCD_FILE=fcd_file, SIM_FCD_OUTPUT=lateral_gap_output):
+            timed("lateral_gap", 1, [lateral_gap_output],
+                  runpy.run_path, os.path.join(REPO_DIR, LATERAL_GAP_SCRIPT), None, "__main__")
+        # Imported here so its log file lands in the scratch directory like the compile scripts'
+        import FCD_SurrogateSafety
+        surrogate = timed("surrogate_safety", 1, [], FCD_SurrogateSafety.analyse_fcd, fcd_file)
+        pair_pets = {}
+        for manoeuvre in ("follow", "cut_in"):
+            pair_file = os.path.join(workdir, f"fcd_{manoeuvre}.xml")
+            fixtures.write_pair_fcd(pair_file, manoeuvre)
+            pair_pets[manoeuvre] = FCD_SurrogateSafety.analyse_fcd(pair_file)["min_pet"]
+    finally:
+        os.chdir(cwd)
+
+    # Results expected from the fixtures
+    expected = [expected_run_outputs(name, args.vehicles) for name in os.listdir(route_files_dir)
+                if name.endswith(".xml")]
+    total_collisions = sum(len(e["collisions"]) for e in expected)
+    compiled = {script: pd.read_excel(os.path.join(output_dir, path))
+                for script, path in COMPILED_OUTPUTS.items()
+                if os.path.exists(os.path.join(output_dir, path))}
+    checks = {
+        "route files": (_count_files(route_files_dir), runs),
+        "configs": (len(config_files), runs),
+        "successful runs": (sum(r["status"] == Automation.STATUS_SUCCESS for r in results), runs),
+        "filtered collision files": (_count_files(filtered_collisions_dir), sum(e["v_0_victim"] for e in expected)),
+        "compiled route rows": (len(compiled.get("Compilation_Route Files.py", [])), runs),
+        "compiled collision rows": (len(compiled.get("All_Compilation_Collisions.py", [])), total_collisions),
+        "compiled statistics rows": (len(compiled.get("Compilation_Statistics.py", [])), runs),
+        "statistics collisions": (int(compiled["Compilation_Statistics.py"]["collisions"].sum())
+                                  if "Compilation_Statistics.py" in compiled else None, total_collisions),
+        "compiled tripinfo rows": (len(compiled.get("Compilation_TripInfo.py", [])), runs),
+        "compiled lanechange rows": (len(compiled.get("Compilation_LaneChange.py", [])), runs),
+        "lanechange event rows": (int(compiled["Compilation_LaneChangeEvents.py"]["n_lane_changes"].sum())
+                                  if "Compilation_LaneChangeEvents.py" in compiled else None,
+                                  sum(e["lanechange_rows"] for e in expected)),
+        "lateral gap rows": (len(pd.read_excel(lateral_gap_output)) if os.path.exists(lateral_gap_output) else None,
+                             planted_pairs),
+        "surrogate TTC at planted pair": (surrogate["min_ttc"] == 0 and surrogate["min_ttc_vehicle"].startswith("shadow_"),
+                                          True),
+        "surrogate PET following across an edge boundary": (pair_pets["follow"], float("inf")),
+        "surrogate PET at cut-in": (bool(pair_pets["cut_in"] < FCD_SurrogateSafety.PET_HORIZON), True)
+    }
+    if "fcd-output" in Automation.OUTPUT_PROFILES[args.output_profile]["outputs"]:
+        checks["fcd files"] = (_count_files(output_dirs["fcd-output"]), runs)
+    digests = {script: _frame_digest(df) for script, df in compiled.items()}
+    return stages, checks, digests
+
+def check_golden(golden_file, settings, digests, update):
+    """Compare compiled-table digests with the golden file.
+
+    Returns the scripts whose digest differs, or None if no digests are recorded for these
+    settings. The file is only written with update=True.
+    """
+    key = json.dumps(settings, sort_keys=True)
+    golden = {}
+    if os.path.exists(golden_file):
+        with open(golden_file) as f:
+            golden = json.load(f)
+    if update:
+        golden[key] = digests
+        with open(golden_file, "w") as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+        print(f"Golden digests updated in {golden_file}")
+        return []
+    if key not in golden:
+        return None
+    return [script for script, digest in digests.items() if golden[key].get(script) != digest]
+
+def print_report(stages, checks, mismatches):
+    print(f"\n{'Stage':<32}{'Wall s':>10}{'CPU s':>10}{'Items/s':>12}{'MB out':>10}{'MB/s':>10}")
+    for record in stages:
+        wall = record["wall_time"]
+        mb = record["bytes_written"] / (1024 * 1024)
+        rate = record["items"] / wall if wall > 0 else float("inf")
+        mb_rate = mb / wall if wall > 0 else float("inf")
+        cpu = record["cpu_time"] + record["children_cpu_time"]
+        print(f"{record['stage']:<32}{wall:>10.3f}{cpu:>10.3f}{rate:>12.1f}{mb:>10.2f}{mb_rate:>10.2f}")
+
+    print("\nOutput checks:")
+    for name, (actual, expected) in checks.items():
+        print(f"  {'OK  ' if actual == expected else 'FAIL'} {name}: {actual} (expected {expected})")
+    if mismatches is None:
+        print("  --   golden digests not recorded for these settings "
+              "(record them with --update-golden once the output is verified)")
+    for script in mismatches or []:
+        print(f"  FAIL golden digest differs for {script}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sweep pipeline on synthetic fixtures.")
+    parser.add_argument("--ids", type=int, default=1, help="Number of swept vType IDs")
+    parser.add_argument("--values", type=int, default=2, help="Values per swept parameter")
+    parser.add_argument("--vtypes", type=int, default=4, help="vTypes in the route template")
+    parser.add_argument("--vehicles", type=int, default=200, help="Vehicles per fake SUMO run")
+    parser.add_argument("--sumo-runtime", type=float, default=0.1, help="Seconds per fake SUMO run")
+    parser.add_argument("--fcd-mb", type=float, default=5, help="Size of the FCD fixture in MB")
+    parser.add_argument("--output-profile", default="ego", choices=sorted(Automation.OUTPUT_PROFILES),
+                        help="SUMO output profile of the generated configurations")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel SUMO runs")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-run timeout in seconds")
+    parser.add_argument("--workdir", default=None, help="Empty scratch directory (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--results", default="benchmark_results.json", help="JSON file for the report")
+    parser.add_argument("--golden", default=os.path.join(BENCHMARK_DIR, "golden.json"),
+                        help="JSON file of golden digests per table settings")
+    parser.add_argument("--update-golden", action="store_true", help="Record the golden digests of these settings")
+    parser.add_argument("--profile", nargs="*", default=[], help="Stages to run under cProfile ('*' for all)")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    if args.workdir:
+        if os.path.exists(args.workdir) and os.listdir(args.workdir):
+            parser.error(f"work directory '{args.workdir}' is not empty")
+        os.makedirs(args.workdir, exist_ok=True)
+        workdir = os.path.abspath(args.workdir)
+    else:
+        workdir = tempfile.mkdtemp(prefix="sumo_bench_")
+
+    try:
+        stages, checks, digests = run_benchmark(args, workdir)
+        # Only these settings change the compiled tables; the FCD size and the output profile do not
+        table_settings = {"ids": args.ids, "values": args.values, "vtypes": args.vtypes, "vehicles": args.vehicles}
+        settings = dict(table_settings, fcd_mb=args.fcd_mb, output_profile=args.output_profile)
+        mismatches = check_golden(args.golden, table_settings, digests, args.update_golden)
+        print_report(stages, checks, mismatches)
+
+        results_file = args.results
+        with open(results_file, "w") as f:
+            json.dump({"settings": settings, "stages": stages,
+                       "checks": {name: {"actual": a, "expected": e} for name, (a, e) in checks.items()},
+                       "golden_mismatches": mismatches}, f, indent=2, default=str)
+        print(f"\nResults written to {results_file}")
+        failed = mismatches or any(actual != expected for actual, expected in checks.values())
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())